@@ -185,6 +185,12 @@ class ToolingArguments(Singleton):
             help=f"{Fore.GREEN}Select data from X months before the latest month in CUR table{Style.RESET_ALL}",
             default=0)
 
+        # --athena-result-reuse; Reuse Athena results of identical CUR queries
+        parser.add_argument(
+            '--athena-result-reuse', type=int, metavar='MINUTES',
+            help=f"{Fore.GREEN}Reuse the results of an identical CUR query run in the last MINUTES minutes instead of scanning the CUR again (default 0, disabled). Only applies to the queries run through the shared CUR query path and to the DynamoDB IA and DocumentDB idle checks, the other CUR checks always run their queries{Style.RESET_ALL}",
+            default=0)
+
         # --checks; Add checks parameter to skip menu selection
         parser.add_argument(
             '--checks', nargs='+',
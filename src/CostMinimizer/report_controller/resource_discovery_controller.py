@@ -19,6 +19,7 @@ class ResourceDiscoveryController:
         self.logger = self.appConfig.logger
         self.cur_type = None
         self.resource_id_column_exists = False
+        self.billing_period_column_exists = False
         self.precondition_reports = {'cur_preconditionavginstancecost.cur': True}
 
     def check_column_exists(self, list_to_scan, column_name):
@@ -83,6 +84,10 @@ class ResourceDiscoveryController:
         if self.appConfig.mode == 'cli':
             self.appConfig.console.print(f'Is line_item_resource_id columns is present in the CUR table ? {self.resource_id_column_exists}')
 
+        # CUR 2.0 data exports are partitioned by billing_period, which SHOW COLUMNS lists with the other columns
+        self.billing_period_column_exists = any(row['Data'][0]['VarCharValue'].strip() == 'billing_period' for row in result)
+        self.logger.info(f'Using Athena, verify if billing_period exists: {self.billing_period_column_exists}')
+
         # scan result to descover the type of CUR
         l_type_of_CUR = 'Unknown'
         for row in result:
@@ -387,8 +387,9 @@ class ReportOutputExcel(ReportOutputHandlerBase):
                 logging.exception("Error occurred while closing SMTP connection", e, stack_info=True, exc_info=True)  # import logging
 
     def create_writer(self, output_filename) -> xlsxwriter.workbook.Workbook:
-        # create and return writer
-        writer = pd.ExcelWriter(output_filename, engine='xlsxwriter')
+        # create and return writer, NaN and inf values are written as Excel errors instead of failing
+        writer = pd.ExcelWriter(output_filename, engine='xlsxwriter',
+                                engine_kwargs={'options': {'nan_inf_to_errors': True}})
 
         return writer
 
@@ -10,25 +10,381 @@ import os
 import sys
 import logging
 import pandas as pd
+import io
 import json
-from typing import Optional, Dict, Any
+import re
+import functools
 import sqlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Dict, Any
 import datetime as time
+import time as _time
 
 # Required to load modules from vendored su6bfolder (for clean development env)
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "./vendored"))
+logger = logging.getLogger(__name__)
 
 from abc import ABC
 from CostMinimizer.report_providers.report_providers import ReportBase
 from pyathena.pandas.result_set import AthenaPandasResultSet
 
 from botocore.exceptions import ClientError
+from botocore.config import Config as bc_config
+from dateutil.relativedelta import relativedelta
+from xlsxwriter.utility import xl_col_to_name
 
 from ...config.config import Config
 
+_GIB = 1 << 30  # 1024**3 bytes
+_KIB512 = 512 << 10  # EBS snapshot block size in bytes
+
+# Canonical AWS region code -> Price List location name, allocated once at import
+_REGION_CODE_TO_NAME = {
+    # Americas
+    'us-east-1': 'US East (N. Virginia)',
+    'us-east-2': 'US East (Ohio)',
+    'us-west-1': 'US West (N. California)',
+    'us-west-2': 'US West (Oregon)',
+    'ca-central-1': 'Canada (Central)',
+    'sa-east-1': 'South America (São Paulo)',
+
+    # Europe
+    'eu-north-1': 'Europe (Stockholm)',
+    'eu-west-1': 'Europe (Ireland)',
+    'eu-west-2': 'Europe (London)',
+    'eu-west-3': 'Europe (Paris)',
+    'eu-central-1': 'Europe (Frankfurt)',
+    'eu-central-2': 'Europe (Zurich)',
+    'eu-south-1': 'Europe (Milan)',
+    'eu-south-2': 'Europe (Spain)',
+
+    # Asia Pacific
+    'ap-east-1': 'Asia Pacific (Hong Kong)',
+    'ap-south-1': 'Asia Pacific (Mumbai)',
+    'ap-south-2': 'Asia Pacific (Hyderabad)',
+    'ap-southeast-1': 'Asia Pacific (Singapore)',
+    'ap-southeast-2': 'Asia Pacific (Sydney)',
+    'ap-southeast-3': 'Asia Pacific (Jakarta)',
+    'ap-southeast-4': 'Asia Pacific (Melbourne)',
+    'ap-northeast-1': 'Asia Pacific (Tokyo)',
+    'ap-northeast-2': 'Asia Pacific (Seoul)',
+    'ap-northeast-3': 'Asia Pacific (Osaka)',
+
+    # Middle East
+    'me-south-1': 'Middle East (Bahrain)',
+    'me-central-1': 'Middle East (UAE)',
+
+    # Africa
+    'af-south-1': 'Africa (Cape Town)',
+
+    # China
+    'cn-north-1': 'China (Beijing)',
+    'cn-northwest-1': 'China (Ningxia)',
+
+    # AWS GovCloud
+    'us-gov-east-1': 'AWS GovCloud (US-East)',
+    'us-gov-west-1': 'AWS GovCloud (US-West)',
+
+    # Local Zones
+    'us-west-2-lax-1a': 'US West (Los Angeles)',
+    'us-west-2-las-1': 'US West (Las Vegas)',
+
+    # Wavelength Zones
+    'us-east-1-wl1-bos-wlz-1': 'US East (Boston)',
+    'us-east-1-wl1-nyc-wlz-1': 'US East (New York)',
+
+    # Israel
+    'il-central-1': 'Israel (Tel Aviv)'
+}
+
+# Regions also published under a legacy Price List location name, canonical name last
+_REGION_CODE_TO_ALIASES = {
+    code: (_REGION_CODE_TO_NAME[code].replace('Europe', 'EU', 1), _REGION_CODE_TO_NAME[code])
+    for code in ('eu-north-1', 'eu-west-1', 'eu-west-2', 'eu-west-3',
+                 'eu-central-1', 'eu-central-2', 'eu-south-1', 'eu-south-2')
+}
+_REGION_NAME_TO_ALIASES = {aliases[-1]: aliases for aliases in _REGION_CODE_TO_ALIASES.values()}
+
+
+# Mapping dictionary for instance families to their Graviton equivalents
+_GRAVITON_EQUIVALENT_MAPPING = {
+    # General Purpose (T, M series)
+    't1': 't4g',
+    't2': 't4g',
+    't3': 't4g',
+    't3a': 't4g',
+    'm1': 'm6g',
+    'm2': 'm6g',
+    'm3': 'm6g',
+    'm4': 'm6g',
+    'm5': 'm6g',
+    'm5a': 'm6g',
+    'm5ad': 'm6gd',
+    'm5d': 'm6gd',
+    'm6a': 'm7g',
+    'm6i': 'm7g',
+    'm6id': 'm7gd',
+    'm7a': 'm8g',
+    'm7i': 'm8g',
+
+    # Compute Optimized (C series)
+    'c1': 'c6g',
+    'c3': 'c6g',
+    'c4': 'c6g',
+    'c5': 'c6g',
+    'c5a': 'c6g',
+    'c5ad': 'c6gd',
+    'c5d': 'c6gd',
+    'c5n': 'c6gn',
+    'c6a': 'c7g',
+    'c6i': 'c7g',
+    'c6id': 'c7gd',
+    'c6in': 'c7gn',
+    'c7a': 'c8g',
+    'c7i': 'c8g',
+
+    # Memory Optimized (R series)
+    'r3': 'r6g',
+    'r4': 'r6g',
+    'r5': 'r6g',
+    'r5a': 'r6g',
+    'r5ad': 'r6gd',
+    'r5d': 'r6gd',
+    'r6a': 'r7g',
+    'r6i': 'r7g',
+    'r6id': 'r7gd',
+    'r7a': 'r8g',
+    'r7i': 'r8g',
+
+    # Storage Optimized (I series)
+    'i2': 'i4g',
+    'i3': 'i4g',
+    'i3en': 'is4gen',
+    'i4i': 'i8g',
+
+    # Database instances
+    'db.m1': 'db.m6g',
+    'db.m2': 'db.m6g',
+    'db.m3': 'db.m6g',
+    'db.m4': 'db.m6g',
+    'db.m5': 'db.m6g',
+    'db.m5d': 'db.m6g',
+    'db.m6i': 'db.m7g',
+    'db.r3': 'db.r6g',
+    'db.r4': 'db.r6g',
+    'db.r5': 'db.r6g',
+    'db.r6i': 'db.r7g',
+    'db.t1': 'db.t4g',
+    'db.t2': 'db.t4g',
+    'db.t3': 'db.t4g',
+
+    # Cache instances
+    'cache.m1': 'cache.m6g',
+    'cache.m2': 'cache.m6g',
+    'cache.m3': 'cache.m6g',
+    'cache.m4': 'cache.m6g',
+    'cache.m5': 'cache.m6g',
+    'cache.m6': 'cache.m7g',
+    'cache.r3': 'cache.r6g',
+    'cache.r4': 'cache.r6g',
+    'cache.r5': 'cache.r6g',
+    'cache.t1': 'cache.t4g',
+    'cache.t2': 'cache.t4g',
+    'cache.t3': 'cache.t4g',
+
+    # OpenSearch/Elasticsearch instances
+    'c4.search': 'c6g.search',
+    'c5.search': 'c6g.search',
+    'm3.search': 'm6g.search',
+    'm4.search': 'm6g.search',
+    'm5.search': 'm6g.search',
+    'r3.search': 'r6g.search',
+    'r4.search': 'r6g.search',
+    'r5.search': 'r6g.search',
+}
+
+# Common mapping of x86 to Graviton instance families
+_GRAVITON_FAMILY_MAPPING = {
+    't3': 't4g',
+    'm5': 'm6g',
+    'r5': 'r6g',
+    'c5': 'c6g',
+    # Add more mappings as needed
+}
+
+# Latest available Graviton generation per base instance family type
+_LATEST_GRAVITON_MAP = {
+    # General Purpose
+    't': 't4g',  # Latest is Graviton2
+    'm': 'm8g',  # Latest is Graviton4
+
+    # Compute Optimized
+    'c': 'c8g',  # Latest is Graviton4
+
+    # Memory Optimized
+    'r': 'r8g',  # Latest is Graviton4
+
+    # Storage Optimized
+    'i': 'i8g',  # Latest is Graviton4
+
+    # Database
+    'db.m': 'db.m8g',
+    'db.r': 'db.r8g',
+    'db.t': 'db.t4g',
+
+    # Cache
+    'cache.m': 'cache.m7g',
+    'cache.r': 'cache.r7g',
+    'cache.t': 'cache.t4g',
+
+    # Search
+    'm.search': 'm7g.search',
+    'c.search': 'c7g.search',
+    'r.search': 'r7g.search',
+}
+
+# Base family type of an instance family: optional db./cache. prefix, family letters, optional .search suffix
+_FAMILY_PREFIX_RE = re.compile(r'^((?:db\.|cache\.)?[a-z]+)\d*[a-z]*(\.search)?')
+
+
+# describe_snapshots accepts up to 1000 snapshot ids per call, regions are described concurrently
+_DESCRIBE_SNAPSHOTS_MAX_IDS = 1000
+_SNAPSHOT_MAX_WORKERS = 8
+
+
+# Date pattern YYYY-MM-DD checked by CurBase.is_valid_date
+_ISO_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+# First and last day of the latest CUR billing month, shifted by a month offset passed as execution parameter
+_CUR_MIN_MAX_DATE_SQL = (
+    "SELECT "
+    "CAST(DATE_TRUNC('month', DATE_ADD('month', ?, MAX(DISTINCT(bill_billing_period_start_date)))) AS DATE), "
+    "CAST(DATE_ADD('month', 1, DATE_TRUNC('month', DATE_ADD('month', ?, MAX(DISTINCT(bill_billing_period_start_date))))) - INTERVAL '1' DAY AS DATE) "
+    "FROM {cur_table}"
+)
+
+
+# The pricing tables are static for a run and the graviton reports look up the same
+# (instance type, region, ...) keys for many CUR rows, so memoize the SQLite round-trips.
+# Both caches are cleared by clear_db_lookup_caches() once a CUR report is post-processed.
+@functools.lru_cache(maxsize=4096)
+def _price_from_db(database, method_name, *args):
+    result = getattr(database, method_name)(*args)
+
+    # Check if a result is a float value
+    return result if isinstance(result, float) else None
+
+
+@functools.lru_cache(maxsize=4096)
+def _graviton_equivalent_from_db(database, instance_type):
+    result = database.get_graviton_equivalent_from_db(instance_type)
+
+    # Check if a result was found
+    return result if result else ''
+
+
+def clear_db_lookup_caches():
+    """Release the memoized pricing and graviton lookups"""
+    _price_from_db.cache_clear()
+    _graviton_equivalent_from_db.cache_clear()
+
+
+# The reports issue the same handful of SQL variants on every run, so format each distinct query only once
+@functools.lru_cache(maxsize=128)
+def format_sql(query):
+    """Upper-case the SQL keywords and strip the comments of a query, as expected by the CUR reports"""
+    return sqlparse.format(query, keyword_case='upper', reindent=False, strip_comments=True)
+
+
+# Athena query states after which get_query_execution no longer needs to be polled
+_ATHENA_TERMINAL_STATES = ('SUCCEEDED', 'FAILED', 'CANCELLED')
+_ATHENA_POLL_INITIAL_DELAY = 0.1  # seconds
+_ATHENA_POLL_MAX_DELAY = 2.0  # seconds
+_ATHENA_POLL_BACKOFF = 1.7
+
+def _wait_for_athena(athena_client, query_execution_id):
+    """
+    Poll an Athena query until it reaches a terminal state and return the last get_query_execution response
+
+    Short CUR queries usually finish well under a second, so start polling at 100ms and back off
+    exponentially up to 2s instead of sleeping a fixed second between each call.
+    """
+    delay = _ATHENA_POLL_INITIAL_DELAY
+    response = athena_client.get_query_execution(QueryExecutionId=query_execution_id)
+    while response['QueryExecution']['Status']['State'] not in _ATHENA_TERMINAL_STATES:
+        _time.sleep(delay)
+        delay = min(delay * _ATHENA_POLL_BACKOFF, _ATHENA_POLL_MAX_DELAY)
+        response = athena_client.get_query_execution(QueryExecutionId=query_execution_id)
+    return response
+
+
+def _start_athena_query(athena_client, result_reuse_minutes=0, **query_args):
+    """
+    Start an Athena query, reusing the results of an identical query run in the last result_reuse_minutes
+
+    A reused result skips the CUR scan entirely. Result reuse requires Athena engine version 3,
+    so a workgroup rejecting it gets the query started again without reuse.
+    """
+    if result_reuse_minutes > 0:
+        try:
+            return athena_client.start_query_execution(
+                ResultReuseConfiguration={'ResultReuseByAgeConfiguration': {'Enabled': True, 'MaxAgeInMinutes': result_reuse_minutes}},
+                **query_args)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'InvalidRequestException':
+                raise
+            logger.info(f"Athena result reuse not available, running the query without it: {e}")
+    return athena_client.start_query_execution(**query_args)
+
+
+def _iter_athena_rows(athena_client, query_execution_id):
+    """
+    Yield every result row of a succeeded Athena query, the column header being the first row
+
+    get_query_results returns at most 1000 rows per call, so walk all the pages instead of
+    silently truncating large results, one page in memory at a time. Athena only includes
+    the header in the first page.
+    """
+    paginator = athena_client.get_paginator('get_query_results')
+    for page in paginator.paginate(QueryExecutionId=query_execution_id, PaginationConfig={'PageSize': 1000}):
+        yield from page['ResultSet']['Rows']
+
+
+def _get_athena_rows(athena_client, query_execution_id):
+    """Return every result row of a succeeded Athena query as a list, the column header being the first row"""
+    return list(_iter_athena_rows(athena_client, query_execution_id))
+
+
+def _athena_rows_to_dataframe(rows):
+    """Build a DataFrame of strings from get_query_results rows, the first row holding the column names"""
+    if not rows:
+        return pd.DataFrame()
+
+    header = [cell.get('VarCharValue', '') for cell in rows[0]['Data']]
+    data = [row['Data'] for row in rows[1:]]
+    df = pd.DataFrame({i: [cells[i].get('VarCharValue', '') for cells in data] for i in range(len(header))})
+    df.columns = header
+    return df
+
+
+def _read_athena_result_csv(s3_client, query_execution):
+    """
+    Load the CSV result file written by a succeeded Athena query into a DataFrame of strings
+
+    Reading the file straight from the S3 output location lets pandas parse it in C instead of
+    unwrapping the VarCharValue cells of get_query_results pages in Python. NULL cells are read as ''.
+    """
+    output_location = query_execution['ResultConfiguration']['OutputLocation']
+    bucket, _, key = output_location.partition('://')[2].partition('/')
+    body = s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+    return pd.read_csv(io.BytesIO(body), dtype=str, keep_default_na=False)
+
 
 #####################################################################################################################################""
 class RegionConversion():
+    # Empty slots so that subclasses can declare their own fixed attribute sets
+    __slots__ = ()
 
     def get_region_code(self, region_name):
         """
@@ -83,68 +439,12 @@ class RegionConversion():
         Returns:
             str: Region name (e.g., 'US East (N. Virginia)')
         """
-        region_names = {
-            # Americas
-            'us-east-1': 'US East (N. Virginia)',
-            'us-east-2': 'US East (Ohio)',
-            'us-west-1': 'US West (N. California)',
-            'us-west-2': 'US West (Oregon)',
-            'ca-central-1': 'Canada (Central)',
-            'sa-east-1': 'South America (São Paulo)',
-            
-            # Europe
-            'eu-north-1': ('EU (Stockholm)', 'Europe (Stockholm)'),
-            'eu-west-1': ('EU (Ireland)', 'Europe (Ireland)'),
-            'eu-west-2': ('EU (London)', 'Europe (London)'),
-            'eu-west-3': ('EU (Paris)', 'Europe (Paris)'),
-            'eu-central-1': ('EU (Frankfurt)', 'Europe (Frankfurt)'),
-            'eu-central-2': ('EU (Zurich)', 'Europe (Zurich)'),
-            'eu-south-1': ('EU (Milan)', 'Europe (Milan)'),
-            'eu-south-2': ('EU (Spain)', 'Europe (Spain)'),
-            
-            # Asia Pacific
-            'ap-east-1': 'Asia Pacific (Hong Kong)',
-            'ap-south-1': 'Asia Pacific (Mumbai)',
-            'ap-south-2': 'Asia Pacific (Hyderabad)',
-            'ap-southeast-1': 'Asia Pacific (Singapore)',
-            'ap-southeast-2': 'Asia Pacific (Sydney)',
-            'ap-southeast-3': 'Asia Pacific (Jakarta)',
-            'ap-southeast-4': 'Asia Pacific (Melbourne)',
-            'ap-northeast-1': 'Asia Pacific (Tokyo)',
-            'ap-northeast-2': 'Asia Pacific (Seoul)',
-            'ap-northeast-3': 'Asia Pacific (Osaka)',
-            
-            # Middle East
-            'me-south-1': 'Middle East (Bahrain)',
-            'me-central-1': 'Middle East (UAE)',
-            
-            # Africa
-            'af-south-1': 'Africa (Cape Town)',
-            
-            # China
-            'cn-north-1': 'China (Beijing)',
-            'cn-northwest-1': 'China (Ningxia)',
-            
-            # AWS GovCloud
-            'us-gov-east-1': 'AWS GovCloud (US-East)',
-            'us-gov-west-1': 'AWS GovCloud (US-West)',
-            
-            # Local Zones
-            'us-west-2-lax-1a': 'US West (Los Angeles)',
-            'us-west-2-las-1': 'US West (Las Vegas)',
-            
-            # Wavelength Zones
-            'us-east-1-wl1-bos-wlz-1': 'US East (Boston)',
-            'us-east-1-wl1-nyc-wlz-1': 'US East (New York)',
-            
-            # Israel
-            'il-central-1': 'Israel (Tel Aviv)'
-        }
-        
-        return region_names.get(region_code, region_code)
+        return _REGION_CODE_TO_NAME.get(region_code, region_code)
 
 #####################################################################################################################################""
 class AWSSnapshots(RegionConversion):
+    __slots__ = ('appConfig', 'ebs_client', 'ec2_client', '_price_cache', 'database', 'logger')
+
     def __init__(self, app):
         self.appConfig = Config()
         # Price List API is only available in us-east-1 or ap-south-1
@@ -155,7 +455,50 @@ class AWSSnapshots(RegionConversion):
         self._price_cache = {}
         self.database = app.database
 
-        self.logger = logging.getLogger(__name__)
+        self.logger = logger
+
+    def _get_snapshot_size_info(self, snapshot, ebs_client):
+        """
+        Build the size information of a snapshot returned by describe_snapshots
+
+        Args:
+            snapshot (dict): Snapshot description as returned by EC2 describe_snapshots
+            ebs_client: EBS direct APIs client of the snapshot region
+        Returns:
+            dict: Dictionary containing size information
+        """
+        snapshot_id = snapshot['SnapshotId']
+        volume_size = snapshot['VolumeSize']  # Size in GiB
+
+        # Initialize size information dictionary
+        size_info = {
+            'snapshot_id': snapshot_id,
+            'volume_size_gib': volume_size,
+            'volume_size_bytes': volume_size * _GIB,  # Convert GiB to bytes
+            'start_time': snapshot['StartTime'],
+            'description': snapshot.get('Description', ''),
+            'state': snapshot['State']
+        }
+
+        # Get block information using EBS direct APIs
+        try:
+            # List all blocks in the snapshot, 10000 is the ListSnapshotBlocks maximum page size
+            # (10x fewer round-trips than the previous 1000 blocks per call)
+            paginator = ebs_client.get_paginator('list_snapshot_blocks')
+            pages = paginator.paginate(SnapshotId=snapshot_id, PaginationConfig={'PageSize': 10000})
+            block_count = sum(len(page.get('Blocks', ())) for page in pages)
+
+            # Calculate actual data size (each block is 512 KiB)
+            actual_size_bytes = block_count * _KIB512  # Convert blocks to bytes
+            size_info['actual_data_size_bytes'] = actual_size_bytes
+            size_info['actual_data_size_gib'] = actual_size_bytes / _GIB
+            size_info['block_count'] = block_count
+
+        except ClientError as e:
+            # Handle case where EBS direct APIs might not be available
+            self.logger.warning(f"Could not get detailed block information: {str(e)}")
+
+        return size_info
 
     def get_snapshot_info(self, snapshot_id, p_region):
         """
@@ -177,62 +520,102 @@ class AWSSnapshots(RegionConversion):
             
             if not response['Snapshots']:
                 return None
-                
-            snapshot = response['Snapshots'][0]
-            volume_size = snapshot['VolumeSize']  # Size in GiB
-            
-            # Initialize size information dictionary
-            size_info = {
-                'snapshot_id': snapshot_id,
-                'volume_size_gib': volume_size,
-                'volume_size_bytes': volume_size * 1024 * 1024 * 1024,  # Convert GiB to bytes
-                'start_time': snapshot['StartTime'],
-                'description': snapshot.get('Description', ''),
-                'state': snapshot['State']
-            }
-            
-            # Get block information using EBS direct APIs
-            try:
-                # List all blocks in the snapshot
-                block_count = 0
-                next_token = None
-                
-                while True:
-                    if next_token:
-                        blocks_response = self.ebs_client.list_snapshot_blocks(
-                            SnapshotId=snapshot_id,
-                            MaxResults=1000,
-                            NextToken=next_token
-                        )
-                    else:
-                        blocks_response = self.ebs_client.list_snapshot_blocks(
-                            SnapshotId=snapshot_id,
-                            MaxResults=1000
-                        )
-                    
-                    # Each block is 512 KiB
-                    block_count += len(blocks_response.get('Blocks', []))
-                    
-                    next_token = blocks_response.get('NextToken')
-                    if not next_token:
-                        break
-                
-                # Calculate actual data size (each block is 512 KiB)
-                actual_size_bytes = block_count * 512 * 1024  # Convert blocks to bytes
-                size_info['actual_data_size_bytes'] = actual_size_bytes
-                size_info['actual_data_size_gib'] = actual_size_bytes / (1024 * 1024 * 1024)
-                size_info['block_count'] = block_count
-                
-            except ClientError as e:
-                # Handle case where EBS direct APIs might not be available
-                self.logger.warning(f"Could not get detailed block information: {str(e)}")
-                
-            return size_info
+
+            return self._get_snapshot_size_info(response['Snapshots'][0], self.ebs_client)
             
         except ClientError as e:
             self.logger.warning(f"Error getting snapshot information: {str(e)}")
             return None
 
+    def _describe_snapshots(self, snapshot_ids, ec2_client):
+        """
+        Describe EBS snapshots of a same region by chunks of up to 1000 ids per describe_snapshots call
+
+        A chunk referencing a snapshot that no longer exists is rejected as a whole by EC2,
+        so its snapshots are then described one by one.
+
+        Args:
+            snapshot_ids (list): The IDs of the snapshots, all located in the region of the client
+            ec2_client: EC2 client of the snapshots region
+        Returns:
+            list: Snapshot descriptions, missing snapshots are left out
+        """
+        snapshots = []
+        for i in range(0, len(snapshot_ids), _DESCRIBE_SNAPSHOTS_MAX_IDS):
+            chunk = snapshot_ids[i:i + _DESCRIBE_SNAPSHOTS_MAX_IDS]
+            try:
+                snapshots.extend(ec2_client.describe_snapshots(SnapshotIds=chunk)['Snapshots'])
+            except ClientError:
+                for snapshot_id in chunk:
+                    try:
+                        snapshots.extend(ec2_client.describe_snapshots(SnapshotIds=[snapshot_id])['Snapshots'])
+                    except ClientError as e:
+                        self.logger.warning(f"Error getting snapshot information: {str(e)}")
+        return snapshots
+
+    def get_snapshots_info(self, snapshot_ids, ec2_client, ebs_client):
+        """
+        Get the size information of many EBS snapshots of a same region
+
+        Args:
+            snapshot_ids (list): The IDs of the snapshots, all located in the region of the clients
+            ec2_client: EC2 client of the snapshots region
+            ebs_client: EBS direct APIs client of the snapshots region
+        Returns:
+            dict: Size information dictionaries keyed by snapshot id, missing snapshots are left out
+        """
+        snapshots = self._describe_snapshots(snapshot_ids, ec2_client)
+        return {snapshot['SnapshotId']: self._get_snapshot_size_info(snapshot, ebs_client) for snapshot in snapshots}
+
+    def get_snapshots_info_by_region(self, snapshot_ids_by_region):
+        """
+        Get the size information of EBS snapshots spread over several regions
+
+        All the API calls are I/O bound, so they share a single thread pool: the regions are first
+        described concurrently, then the blocks of every snapshot found are listed concurrently,
+        instead of one region listing its snapshot blocks one after the other.
+
+        Args:
+            snapshot_ids_by_region (dict): Lists of snapshot IDs keyed by region name (e.g., 'US East (N. Virginia)')
+        Returns:
+            dict: Size information dictionaries keyed by (region name, snapshot id)
+        """
+        session = self.appConfig.auth_manager.aws_cow_account_boto_session
+        snapshots_info = {}
+
+        # boto3 sessions are not thread safe, create the regional clients before dispatching the regions
+        clients = {
+            region: (session.client('ec2', region_name=self.get_region_code(region)),
+                     session.client('ebs', region_name=self.get_region_code(region)))
+            for region in snapshot_ids_by_region
+        }
+
+        with ThreadPoolExecutor(max_workers=_SNAPSHOT_MAX_WORKERS) as executor:
+            describe_futures = {
+                executor.submit(self._describe_snapshots, snapshot_ids, clients[region][0]): region
+                for region, snapshot_ids in snapshot_ids_by_region.items()
+            }
+
+            size_futures = {}
+            for future in as_completed(describe_futures):
+                region = describe_futures[future]
+                try:
+                    snapshots = future.result()
+                except Exception as e:
+                    self.logger.warning(f"Error getting snapshots information in region {region}: {str(e)}")
+                    continue
+                for snapshot in snapshots:
+                    size_future = executor.submit(self._get_snapshot_size_info, snapshot, clients[region][1])
+                    size_futures[size_future] = (region, snapshot['SnapshotId'])
+
+            for future in as_completed(size_futures):
+                try:
+                    snapshots_info[size_futures[future]] = future.result()
+                except Exception as e:
+                    self.logger.warning(f"Error getting snapshot information of {size_futures[future][1]}: {str(e)}")
+
+        return snapshots_info
+
     def print_snapshot_size_info(self, size_info):
         """
         Print formatted snapshot size information
@@ -258,6 +641,8 @@ class AWSSnapshots(RegionConversion):
 
 #####################################################################################################################################""
 class AWSPricing():
+    __slots__ = ('appConfig', 'pricing_client', 'ec2_client', '_price_cache', 'database', 'logger')
+
     def __init__(self, app):
         self.appConfig = Config()
         # Price List API is only available in us-east-1 or ap-south-1
@@ -268,37 +653,19 @@ class AWSPricing():
         self._price_cache = {}
         self.database = app.database
 
-        self.logger = logging.getLogger(__name__)
+        self.logger = logger
 
     # function get instance price using table cow_awspricingec2 from database where the parameter are instance_type, region, operating_system, tenancy and pre_installed_software
     def get_ec2instance_price_from_db(self, instance_type, region, operating_system, tenancy, pre_installed_software):
-        result = self.database.get_ec2instance_price_from_db( instance_type, region, operating_system, tenancy, pre_installed_software)
-
-        # Check if a result is a float value
-        if isinstance(result, float):
-            return result
-        else:
-            return None
+        return _price_from_db(self.database, 'get_ec2instance_price_from_db', instance_type, _REGION_NAME_TO_ALIASES.get(region, region), operating_system, tenancy, pre_installed_software)
 
     # function get instance price using table cow_awspricingdb from database where the parameter are instance_type, region, operating_system, tenancy and pre_installed_software
     def get_dbinstance_price_from_db(self, instance_type, region, database_engine, deployment_option, pre_installed_software):
-        result = self.database.get_dbinstance_price_from_db( instance_type, region, database_engine, deployment_option, pre_installed_software)
-
-        # Check if a result is a float value
-        if isinstance(result, float):
-            return result
-        else:
-            return None
+        return _price_from_db(self.database, 'get_dbinstance_price_from_db', instance_type, _REGION_NAME_TO_ALIASES.get(region, region), database_engine, deployment_option, pre_installed_software)
 
     # function get lambda price using table cow_awspricinglambda from database where the parameter are region, usagetype
     def get_lambda_price_from_db(self, region, usage_type):
-        result = self.database.get_lambda_price_from_db( region, usage_type)
-
-        # Check if a result is a float value
-        if isinstance(result, float):
-            return result
-        else:
-            return None
+        return _price_from_db(self.database, 'get_lambda_price_from_db', _REGION_NAME_TO_ALIASES.get(region, region), usage_type)
 
     # get instance price using API AWS where the parameter are instance_type, region, operating_system, tenancy
     def get_instance_price(self, 
@@ -331,16 +698,8 @@ class AWSPricing():
             return self._price_cache[cache_key]
             
         # Convert region to region description (e.g., us-east-1 to US East (N. Virginia))
-        region_map = {
-            'us-east-1': 'US East (N. Virginia)',
-            'us-east-2': 'US East (Ohio)',
-            'us-west-1': 'US West (N. California)',
-            'us-west-2': 'US West (Oregon)',
-            # Add more regions as needed
-        }
-        
-        region_description = region_map.get(region)
-        if not region_description:
+        region_description = _REGION_CODE_TO_NAME.get(region)
+        if region_description is None:
             raise ValueError(f"Region mapping not found for {region}")
 
         try:
@@ -425,9 +784,9 @@ class AWSPricing():
             dict: Price information including on-demand pricing
         """
 
-        # Convert single region to tuple for consistent handling
+        # Convert single region to tuple for consistent handling, including its legacy location name if any
         if isinstance(region, str):
-            region_values = (region,)
+            region_values = _REGION_NAME_TO_ALIASES.get(region, (region,))
         else:
             region_values = region
 
@@ -563,6 +922,7 @@ class AWSPricing():
 
 #####################################################################################################################################""
 class InstanceConversionToGraviton(RegionConversion):
+    __slots__ = ('appConfig', 'database', 'logger', '_clients')
 
     def __init__(self, appInstance):
         #ToDo remove appInstance
@@ -570,220 +930,64 @@ class InstanceConversionToGraviton(RegionConversion):
         self.appConfig = Config()
         self.database = self.appConfig.database
 
+        self.logger = logger
+
+        # boto3 clients reused across lookups, keyed by service name
+        self._clients = {}
+
+    def _client(self, service):
+        """Return a lazily created boto3 client for service in the default selected region"""
+        client = self._clients.get(service)
+        if client is None:
+            client = self.appConfig.auth_manager.aws_cow_account_boto_session.client(
+                service,
+                region_name=self.appConfig.default_selected_region,
+                config=bc_config(max_pool_connections=50, retries={'max_attempts': 10, 'mode': 'adaptive'}))
+            self._clients[service] = client
+        return client
+
     def get_graviton_equivalent(self, instance_family):
         # Remove any suffix after dot (e.g., 'search' or 'elasticsearch')
         base_family = instance_family
-        
-        # Mapping dictionary for instance families to their Graviton equivalents
-        graviton_mapping = {
-            # General Purpose (T, M series)
-            't1': 't4g',
-            't2': 't4g',
-            't3': 't4g',
-            't3a': 't4g',
-            'm1': 'm6g',
-            'm2': 'm6g',
-            'm3': 'm6g',
-            'm4': 'm6g',
-            'm5': 'm6g',
-            'm5a': 'm6g',
-            'm5ad': 'm6gd',
-            'm5d': 'm6gd',
-            'm6a': 'm7g',
-            'm6i': 'm7g',
-            'm6id': 'm7gd',
-            'm7a': 'm8g',
-            'm7i': 'm8g',
-
-            # Compute Optimized (C series)
-            'c1': 'c6g',
-            'c3': 'c6g',
-            'c4': 'c6g',
-            'c5': 'c6g',
-            'c5a': 'c6g',
-            'c5ad': 'c6gd',
-            'c5d': 'c6gd',
-            'c5n': 'c6gn',
-            'c6a': 'c7g',
-            'c6i': 'c7g',
-            'c6id': 'c7gd',
-            'c6in': 'c7gn',
-            'c7a': 'c8g',
-            'c7i': 'c8g',
-
-            # Memory Optimized (R series)
-            'r3': 'r6g',
-            'r4': 'r6g',
-            'r5': 'r6g',
-            'r5a': 'r6g',
-            'r5ad': 'r6gd',
-            'r5d': 'r6gd',
-            'r6a': 'r7g',
-            'r6i': 'r7g',
-            'r6id': 'r7gd',
-            'r7a': 'r8g',
-            'r7i': 'r8g',
-
-            # Storage Optimized (I series)
-            'i2': 'i4g',
-            'i3': 'i4g',
-            'i3en': 'is4gen',
-            'i4i': 'i8g',
-
-            # Database instances
-            'db.m1': 'db.m6g',
-            'db.m2': 'db.m6g',
-            'db.m3': 'db.m6g',
-            'db.m4': 'db.m6g',
-            'db.m5': 'db.m6g',
-            'db.m5d': 'db.m6g',
-            'db.m6i': 'db.m7g',
-            'db.r3': 'db.r6g',
-            'db.r4': 'db.r6g',
-            'db.r5': 'db.r6g',
-            'db.r6i': 'db.r7g',
-            'db.t1': 'db.t4g',
-            'db.t2': 'db.t4g',
-            'db.t3': 'db.t4g',
-
-            # Cache instances
-            'cache.m1': 'cache.m6g',
-            'cache.m2': 'cache.m6g',
-            'cache.m3': 'cache.m6g',
-            'cache.m4': 'cache.m6g',
-            'cache.m5': 'cache.m6g',
-            'cache.m6': 'cache.m7g',
-            'cache.r3': 'cache.r6g',
-            'cache.r4': 'cache.r6g',
-            'cache.r5': 'cache.r6g',
-            'cache.t1': 'cache.t4g',
-            'cache.t2': 'cache.t4g',
-            'cache.t3': 'cache.t4g',
-
-            # OpenSearch/Elasticsearch instances
-            'c4.search': 'c6g.search',
-            'c5.search': 'c6g.search',
-            'm3.search': 'm6g.search',
-            'm4.search': 'm6g.search',
-            'm5.search': 'm6g.search',
-            'r3.search': 'r6g.search',
-            'r4.search': 'r6g.search',
-            'r5.search': 'r6g.search',
-        }
 
-        return graviton_mapping.get(base_family)
+        return _GRAVITON_EQUIVALENT_MAPPING.get(base_family)
 
     # get graviton equivalent from an instance type in parameter and using cow_gravitonconversion table
     def get_graviton_equivalent_from_db(self, instance_type):
-        result = self.database.get_graviton_equivalent_from_db( instance_type)
+        return _graviton_equivalent_from_db(self.database, instance_type)
 
-        # Check if a result was found
-        if result:
-            return result
-        else:
-            return ''
+    def _latest_for_family(self, instance_family):
+        """
+        Get the latest available Graviton generation for a given instance family
+        """
+        # Extract the base family type (e.g., 'm' from 'm5', 'db.m' from 'db.m5' or 'm.search' from 'm5.search')
+        match = _FAMILY_PREFIX_RE.match(instance_family)
+        if not match:
+            return None
+        return _LATEST_GRAVITON_MAP.get(match.group(1) + (match.group(2) or ''))
 
     def get_latest_graviton(self, instance_family):
         """
         Get the latest available Graviton generation for a given instance family
         """
-        # Remove any suffix after dot
-        base_family = instance_family.split('.')[0]
-        
-        latest_graviton_mapping = {
-            # General Purpose
-            't': 't4g',  # Latest is Graviton2
-            'm': 'm8g',  # Latest is Graviton4
-            
-            # Compute Optimized
-            'c': 'c8g',  # Latest is Graviton4
-            
-            # Memory Optimized
-            'r': 'r8g',  # Latest is Graviton4
-            
-            # Storage Optimized
-            'i': 'i8g',  # Latest is Graviton4
-            
-            # Database
-            'db.m': 'db.m8g',
-            'db.r': 'db.r8g',
-            'db.t': 'db.t4g',
-            
-            # Cache
-            'cache.m': 'cache.m7g',
-            'cache.r': 'cache.r7g',
-            'cache.t': 'cache.t4g',
-            
-            # Search
-            'm.search': 'm7g.search',
-            'c.search': 'c7g.search',
-            'r.search': 'r7g.search',
-        }
-
-        # Extract the base family type (e.g., 'm' from 'm5' or 'db.m' from 'db.m5')
-        family_type = base_family.rstrip('123456789')
-        return latest_graviton_mapping.get(family_type)
+        return self._latest_for_family(instance_family)
 
     def get_latest_graviton_from_db(self, instance_family):
         """
         Get the latest available Graviton generation for a given instance family
         """
-        # Remove any suffix after dot
-        base_family = instance_family.split('.')[0]
-        
-        latest_graviton_mapping = {
-            # General Purpose
-            't': 't4g',  # Latest is Graviton2
-            'm': 'm8g',  # Latest is Graviton4
-            
-            # Compute Optimized
-            'c': 'c8g',  # Latest is Graviton4
-            
-            # Memory Optimized
-            'r': 'r8g',  # Latest is Graviton4
-            
-            # Storage Optimized
-            'i': 'i8g',  # Latest is Graviton4
-            
-            # Database
-            'db.m': 'db.m8g',
-            'db.r': 'db.r8g',
-            'db.t': 'db.t4g',
-            
-            # Cache
-            'cache.m': 'cache.m7g',
-            'cache.r': 'cache.r7g',
-            'cache.t': 'cache.t4g',
-            
-            # Search
-            'm.search': 'm7g.search',
-            'c.search': 'c7g.search',
-            'r.search': 'r7g.search',
-        }
-
-        # Extract the base family type (e.g., 'm' from 'm5' or 'db.m' from 'db.m5')
-        family_type = base_family.rstrip('123456789')
-        return latest_graviton_mapping.get(family_type)
+        return self._latest_for_family(instance_family)
 
     def get_instance_family_mapping(self, instance_type):
         """Get potential Graviton equivalent instance families"""
-        # Common mapping of x86 to Graviton instance families
-        graviton_mappings = {
-            't3': 't4g',
-            'm5': 'm6g',
-            'r5': 'r6g',
-            'c5': 'c6g',
-            # Add more mappings as needed
-        }
-        
         # Extract the family from instance type (e.g., 't3' from 't3.micro')
-        family = instance_type.split('.')[0]
-        
-        return graviton_mappings.get(family)
+        family, _, _ = instance_type.partition('.')
+
+        return _GRAVITON_FAMILY_MAPPING.get(family)
 
     def get_instance_details(self, instance_type):
         """Get instance type specifications using describe_instance_types"""
-        ec2 = self.appConfig.auth_manager.aws_cow_account_boto_session.client('ec2', region_name=self.appConfig.default_selected_region)
+        ec2 = self._client('ec2')
         
         try:
             response = ec2.describe_instance_types(InstanceTypes=[instance_type])
@@ -801,7 +1005,7 @@ class InstanceConversionToGraviton(RegionConversion):
         
         if not current_specs or not graviton_specs:
             return None
-        
+
         comparison = {
             'current_instance': current_instance,
             'graviton_instance': graviton_instance,
@@ -835,7 +1039,7 @@ class InstanceConversionToGraviton(RegionConversion):
             return None
         
         # Get the size from the original instance type
-        size = instance_type.split('.')[1]
+        _, _, size = instance_type.partition('.')
         potential_graviton = f"{graviton_family}.{size}"
         
         # Compare specifications
@@ -843,11 +1047,9 @@ class InstanceConversionToGraviton(RegionConversion):
         
         return comparison
 
-
     def get_graviton_equivalents(self, instance_id, region, account_id):
-        # Create clients
-        compute_optimizer = self.appConfig.auth_manager.aws_cow_account_boto_session.client('compute-optimizer', region_name=self.appConfig.default_selected_region)
-        ec2 = self.appConfig.auth_manager.aws_cow_account_boto_session.client('ec2', region_name=self.appConfig.default_selected_region)
+        """Get Compute Optimizer Graviton recommendations for an EC2 instance"""
+        compute_optimizer = self._client('compute-optimizer')
 
         try:
             # Get instance recommendations with Graviton preference
@@ -874,7 +1076,7 @@ class InstanceConversionToGraviton(RegionConversion):
                                 'savings_opportunity': option.get('savingsOpportunity', {}).get('value', 0)
                             }
                         })
-            
+
             return recommendations
 
         except Exception as e:
@@ -882,55 +1084,25 @@ class InstanceConversionToGraviton(RegionConversion):
             return None
 
     def get_graviton_equivalents_from_db(self, instance_id, region, account_id):
-        # Create clients
-        compute_optimizer = self.appConfig.auth_manager.aws_cow_account_boto_session.client('compute-optimizer', region_name=self.appConfig.default_selected_region)
-        ec2 = self.appConfig.auth_manager.aws_cow_account_boto_session.client('ec2', region_name=self.appConfig.default_selected_region)
-
-        try:
-            # Get instance recommendations with Graviton preference
-            instance_arn = f"arn:aws:ec2:{region}:{account_id}:instance/{instance_id}"
-            response = compute_optimizer.get_ec2_instance_recommendations(
-                instanceArns=[instance_arn],
-                accountIds=[account_id],
-                recommendationPreferences={
-                    'cpuVendorArchitectures': ['AWS_ARM64']  # This specifies Graviton
-                }
-            )
-
-            recommendations = []
-            if 'instanceRecommendations' in response:
-                for rec in response['instanceRecommendations']:
-                    for option in rec.get('recommendationOptions', []):
-                        recommendations.append({
-                            'current_instance': rec['currentInstanceType'],
-                            'recommended_instance': option['instanceType'],
-                            'performance_risk': option['performanceRisk'],
-                            'projected_utilization': option.get('projectedUtilization', {}),
-                            'savings': {
-                                'estimated_monthly_savings': option.get('estimatedMonthlySavings', {}).get('value', 0),
-                                'savings_opportunity': option.get('savingsOpportunity', {}).get('value', 0)
-                            }
-                        })
-            
-            return recommendations
-
-        except Exception as e:
-            self.logger.warning(f"Getting Graviton equivalents: {str(e)}")
-            return None
+        return self.get_graviton_equivalents(instance_id, region, account_id)
 
 #####################################################################################################################################""
 class CurBase(ReportBase, ABC):
     """Base class for Cost & Usage Report operations using Athena
     >>> cur_report = CurReport()
     >>> cur_report.addReport(GroupBy=[{"Type": "DIMENSION","Key": "SERVICE"}])
-    """    
+    """
+    # Partition format of each (database, table), and whether its $partitions table could be read,
+    # shared by all CUR reports of the run
+    _PARTITION_FORMAT_CACHE = {}
+
     def __init__(self, appConfig):
 
         super().__init__( appConfig)
         self.appConfig = appConfig
         self.config = appConfig.config
 
-        self.logger = logging.getLogger(__name__)
+        self.logger = logger
 
         self.ESTIMATED_SAVINGS_CAPTION = __estimated_savings_caption__
 
@@ -965,7 +1137,8 @@ class CurBase(ReportBase, ABC):
         return True
 
     def post_processing(self):
-        pass
+        # Bound memory held by the per-row pricing lookups once the report data is final
+        clear_db_lookup_caches()
 
     def auth(self):
         """CUR report provider authentication logic"""
@@ -1027,14 +1200,21 @@ class CurBase(ReportBase, ABC):
         pass
 
     def get_partition_format(self):
-        """Get the partition format for the CUR table"""
+        """Get the partition format for the CUR table, looked up once per (database, table) per process"""
+        cache_key = (self.cur_db, self.cur_table)
+        if cache_key in CurBase._PARTITION_FORMAT_CACHE:
+            return CurBase._PARTITION_FORMAT_CACHE[cache_key]
+
         partitions = self.show_partitions()
         if not partitions:
-            return None
-        
-        sample_partition = partitions[0]
-        partition_keys = [part.split('=')[0] for part in sample_partition.split('/')]
-        return '/'.join(partition_keys)
+            partition_format = None
+        else:
+            sample_partition = partitions[0]
+            partition_keys = [part.partition('=')[0] for part in sample_partition.split('/')]
+            partition_format = '/'.join(partition_keys)
+
+        CurBase._PARTITION_FORMAT_CACHE[cache_key] = partition_format
+        return partition_format
 
     def set_fail_query(self, reason='Query failed with an unknown reason.'):
         '''notify the cur report handler to fail the query'''
@@ -1052,6 +1232,9 @@ class CurBase(ReportBase, ABC):
         else:
             #data comes from cache
             self.fetched_query_result = self.dataframe
+            # already a DataFrame, return it as is rather than copying it
+            if isinstance(self.dataframe, pd.DataFrame):
+                return self.dataframe
 
         return pd.DataFrame(self.fetched_query_result) #, columns=self.get_expected_column_headers())
 
@@ -1124,6 +1307,7 @@ class CurBase(ReportBase, ABC):
         # Create a Pandas Excel writer using XlsxWriter as the engine.\
         workbook = writer.book
         workbook_format = self.set_workbook_formatting()
+        savings_format = workbook.add_format(workbook_format['savings_format'])
 
         for report in self.report_result:
             if report == [] or len(report['Data']) == 0:
@@ -1136,20 +1320,16 @@ class CurBase(ReportBase, ABC):
             # Add a new worksheet
             worksheet = workbook.add_worksheet(report['Name'])
 
-            # Convert specific columns to numeric type before writing
-            for col in self.list_cols_currency:
-                try:
-                    df[df.columns[col]] = pd.to_numeric(df[df.columns[col]], errors='coerce')
-                except:
-                    continue
+            # Convert specific columns to numeric type before writing, in one pass over the existing currency columns
+            currency_cols = df.columns[[col for col in self.list_cols_currency if -len(df.columns) <= col < len(df.columns)]]
+            df[currency_cols] = df[currency_cols].apply(pd.to_numeric, errors='coerce')
 
             df.to_excel(writer, sheet_name=report['Name'])
 
             # Format workbook columns in self.list_cols_currency as money
             for col_idx in self.list_cols_currency:
-                col_letter = chr(65 + col_idx + 1)
-                worksheet.set_column(f"{col_letter}:{col_letter}", 30, 
-                                workbook.add_format(workbook_format['savings_format']))
+                col_letter = xl_col_to_name(col_idx + 1)
+                worksheet.set_column(f"{col_letter}:{col_letter}", 30, savings_format)
 
             if self.chart_type_of_excel == 'chart':
     
@@ -1179,11 +1359,12 @@ class CurBase(ReportBase, ABC):
                     l_name_of_column = 'Total Costs'
 
                 # Create pivot chart for potential savings by instance type
-                pivot_data = (df.groupby([df.columns[i] for i in self.group_by])[df.columns[self.graph_range_values_x1]]
+                value_col = df.columns[self.graph_range_values_x1]
+                pivot_data = (df.groupby([df.columns[i] for i in self.group_by], observed=True)[value_col]
                               .sum()
-                              .reset_index()
-                              .query(f"`{df.columns[self.graph_range_values_x1]}` > {self.min_savings_to_display}")
-                              .sort_values(by=df.columns[self.graph_range_values_x1], ascending=False, na_position='last'))
+                              .reset_index())
+                pivot_data = (pivot_data[pivot_data[value_col] > self.min_savings_to_display]
+                              .sort_values(by=value_col, ascending=False, na_position='last'))
 
                 if not pivot_data.empty:
                     # Create a new worksheet for the chart
@@ -1191,14 +1372,11 @@ class CurBase(ReportBase, ABC):
                     l_name_of_worksheet = l_name_of_worksheet[:31]
                     chart_sheet = workbook.add_worksheet(l_name_of_worksheet)
 
-                    # Write the pivot data to the worksheet
-                    index_col = 0
-                    for col in self.group_by:
-                        list_values = [x for x in pivot_data[df.columns[col]].values]
-                        chart_sheet.write_column(f'{chr(65+index_col)}1', ['GroupBy'] + list_values)
-                        index_col = index_col + 1
-                    list_savings = [float(x) for x in pivot_data[df.columns[self.graph_range_values_x1]].values]
-                    chart_sheet.write_column(f'{chr(65+index_col)}1', [l_name_of_column] + list_savings)
+                    # Write the pivot data to the worksheet in a single pass: GroupBy columns then the savings column
+                    out_df = pivot_data[[df.columns[col] for col in self.group_by] + [df.columns[self.graph_range_values_x1]]].copy()
+                    out_df.columns = ['GroupBy'] * len(self.group_by) + [l_name_of_column]
+                    out_df[l_name_of_column] = out_df[l_name_of_column].astype(float)
+                    out_df.to_excel(writer, sheet_name=l_name_of_worksheet, index=False)
 
                     # Create a new chart object
                     chart = workbook.add_chart({'type': 'column'})
@@ -1206,8 +1384,8 @@ class CurBase(ReportBase, ABC):
                     # Configure the chart
                     chart.add_series({
                         'name': l_name_of_column,
-                        'categories': f'=\'{l_name_of_worksheet}\'!$A$2:${chr(65+len(self.group_by)-1)}${len(pivot_data) + 1}',
-                        'values': f'=\'{l_name_of_worksheet}\'!${chr(66+len(self.group_by)-1)}$2:${chr(66+len(self.group_by)-1)}${len(pivot_data) + 1}',
+                        'categories': f'=\'{l_name_of_worksheet}\'!$A$2:${xl_col_to_name(len(self.group_by)-1)}${len(pivot_data) + 1}',
+                        'values': f'=\'{l_name_of_worksheet}\'!${xl_col_to_name(len(self.group_by))}$2:${xl_col_to_name(len(self.group_by))}${len(pivot_data) + 1}',
                         'data_labels': {'value': True, 'num_format': '$#,##0'},
                     })
 
@@ -1219,22 +1397,92 @@ class CurBase(ReportBase, ABC):
 
                     # Insert the chart into the worksheet
                     chart_sheet.insert_chart('D2', chart, {'x_scale': 2, 'y_scale': 1.5})
-                    return
+
+    def run_athena_query(self, athena_client, query, s3_results_queries, athena_database, execution_parameters=None):
+        """Run an Athena query, optionally with positional execution parameters, and return its result rows"""
+        query_args = {
+            'QueryString': query,
+            'QueryExecutionContext': {'Database': athena_database},
+            'ResultConfiguration': {'OutputLocation': s3_results_queries}
+        }
+        if execution_parameters:
+            query_args['ExecutionParameters'] = execution_parameters
+        response = _start_athena_query(athena_client, self.get_athena_result_reuse_minutes(), **query_args)
+
+        query_execution_id = response['QueryExecutionId']
+        self.query_id = query_execution_id
+
+        response = _wait_for_athena(athena_client, query_execution_id)
+        state = response['QueryExecution']['Status']['State']
+
+        if state == 'SUCCEEDED':
+            return _get_athena_rows(athena_client, query_execution_id)
+        else:
+            l_msg = f"Query failed with state: {response['QueryExecution']['Status']['StateChangeReason']}"
+            raise Exception(l_msg)
+
+    def get_athena_result_reuse_minutes(self) -> int:
+        """Maximum age in minutes of the Athena results reused by the CUR queries, 0 when reuse is disabled"""
+        return getattr(getattr(self.appConfig, 'arguments_parsed', None), 'athena_result_reuse', 0) or 0
 
     def is_valid_date(self, date_str):
         """Check if a string is a valid date."""
-        if not date_str:
+        if not date_str or not _ISO_DATE_RE.match(date_str):
             return False
-        
+
         try:
-            # Try to parse the string as a date
-            import datetime
-            datetime.datetime.strptime(date_str, "%Y-%m-%d")
+            # Pattern is YYYY-MM-DD, check it is an actual calendar date
+            time.date.fromisoformat(date_str)
             return True
         except ValueError:
             return False
 
 
+    def _get_latest_billing_month_from_partitions(self, client, cur_db):
+        """
+        Get the first day of the latest billing month from the CUR partitions metadata
+
+        Supports the billing_period=YYYY-MM (CUR 2.0 data exports) and year=YYYY/month=M (legacy CUR) layouts.
+        Returns None when the table is not partitioned that way, so that the caller falls back to scanning the CUR.
+        """
+        # The $partitions table only exists for partitioned tables, do not query it otherwise
+        billing_period_column_exists = getattr(getattr(self.appConfig, 'resource_discovery', None), 'billing_period_column_exists', False)
+        if not billing_period_column_exists and self.get_partition_format() is None:
+            return None
+
+        # A failed read of the partitions is remembered, so that it costs at most one Athena query per table
+        cache_key = (cur_db, self.cur_table, '$partitions')
+        if CurBase._PARTITION_FORMAT_CACHE.get(cache_key) is False:
+            return None
+
+        try:
+            rows = CurBase.run_athena_query(self, client, f'SELECT * FROM "{self.cur_table}$partitions"', self.appConfig.config['cur_s3_bucket'], cur_db)
+        except Exception as e:
+            self.logger.info(f"Unable to read partitions of {self.cur_table}, scanning the CUR table instead: {e}")
+            CurBase._PARTITION_FORMAT_CACHE[cache_key] = False
+            return None
+        CurBase._PARTITION_FORMAT_CACHE[cache_key] = True
+
+        if len(rows) < 2:
+            return None
+
+        columns = [column.get('VarCharValue', '') for column in rows[0]['Data']]
+        billing_months = []
+        for row in rows[1:]:
+            values = dict(zip(columns, (column.get('VarCharValue', '') for column in row['Data'])))
+            try:
+                if 'billing_period' in values:
+                    year, month = values['billing_period'].split('-')[:2]
+                elif 'year' in values and 'month' in values:
+                    year, month = values['year'], values['month']
+                else:
+                    return None
+                billing_months.append(time.date(int(year), int(month), 1))
+            except ValueError:
+                continue
+
+        return max(billing_months) if billing_months else None
+
     def GetMinAndMaxDateFromCurTable(self, client, fqdb_name: str, payer_id: str = '', account_id: str = '', region: str = '', months_back: int = 0):
         # self.minDate and self.maxDate is empty string
         try:
@@ -1245,24 +1493,31 @@ class CurBase(ReportBase, ABC):
             else:
                 self.appConfig.logger.info(l_msg)
 
-            # get minDate and maxDate from the CUR table, used for selection like 1 month records old or 15 days records old
-            # If months_back is provided, subtract that many months from the max date
-            l_SQL = f"""SELECT 
-CAST(DATE_TRUNC('month', DATE_ADD('month', -{months_back}, max(distinct(bill_billing_period_start_date)))) AS DATE), 
-CAST(DATE_ADD('month', 1, DATE_TRUNC('month', DATE_ADD('month', -{months_back}, max(distinct(bill_billing_period_start_date))))) - INTERVAL '1' DAY AS DATE) 
-FROM {self.cur_table};"""
-            l_SQL2 = l_SQL.replace('\n', '').replace('\t', ' ')
-            l_SQL3 = sqlparse.format(l_SQL2, keyword_case='upper', reindent=False, strip_comments=True)
             cur_db = self.appConfig.arguments_parsed.cur_db if (hasattr(self.appConfig.arguments_parsed, 'cur_db') and self.appConfig.arguments_parsed.cur_db is not None) else self.appConfig.config['cur_db']
             # Strip any whitespace or newline characters from the database name
             cur_db = cur_db.strip() if cur_db else ''
-            response = self.run_athena_query(client, l_SQL3, self.appConfig.config['cur_s3_bucket'], cur_db)
-            if len(response) < 2:
+
+            # get minDate and maxDate from the CUR table, used for selection like 1 month records old or 15 days records old
+            # If months_back is provided, subtract that many months from the max date
+            # The latest billing month is read from the partitions metadata first, which avoids scanning the CUR
+            latest_month = self._get_latest_billing_month_from_partitions(client, cur_db)
+            if latest_month is not None:
+                first_day = latest_month - relativedelta(months=months_back)
+                response = None
+                minDate = first_day.isoformat()
+                maxDate = (first_day + relativedelta(months=1) - relativedelta(days=1)).isoformat()
+            else:
+                # The month offset is passed as an execution parameter so the statement text stays the same across calls
+                l_SQL3 = _CUR_MIN_MAX_DATE_SQL.format(cur_table=self.cur_table)
+                month_offset = str(-months_back)
+                response = CurBase.run_athena_query(self, client, l_SQL3, self.appConfig.config['cur_s3_bucket'], cur_db, execution_parameters=[month_offset, month_offset])
+            if response is not None and len(response) < 2:
                 self.logger.warning(f"No resources found for athena request : {l_SQL3}.")
                 self.appConfig.console.print(f"No resources found for athena request : {fqdb_name}. By default, using now() datetime")
             else:
-                minDate = response[1]['Data'][0]['VarCharValue'] if 'VarCharValue' in response[1]['Data'][0] else ''
-                maxDate = response[1]['Data'][1]['VarCharValue'] if 'VarCharValue' in response[1]['Data'][1] else ''
+                if response is not None:
+                    minDate = response[1]['Data'][0]['VarCharValue'] if 'VarCharValue' in response[1]['Data'][0] else ''
+                    maxDate = response[1]['Data'][1]['VarCharValue'] if 'VarCharValue' in response[1]['Data'][1] else ''
 
                 # Display the message in Red if minDate or maxDate are not valid dates, valid pattern is YYYY-MM-DD 
                 # check if minDate and maxDate are valid date
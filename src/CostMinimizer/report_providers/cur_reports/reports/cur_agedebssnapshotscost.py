@@ -4,13 +4,47 @@
 __author__ = "Samuel Lepetre"
 __license__ = "Apache-2.0"
 
-from ..cur_base import CurBase, AWSSnapshots
+from ..cur_base import CurBase, AWSSnapshots, _wait_for_athena, _get_athena_rows, format_sql
 import pandas as pd
-import time
-import sqlparse
+from collections import defaultdict
 from rich.progress import track
 
 
+def _build_sql_template(is_cur_v2, resource_id_column_exists):
+    """Build the query of the report with {cur_table}, {account_id} and {max_date} placeholders"""
+
+    # generation of CUR has 2 types, legacy old and new v2.0 using dataexport.
+    # The structure of Athena depends of the type of CUR
+    # Also, Use may or may not include resource_if into the Athena CUR
+    if is_cur_v2:
+        product_location_condition = "product['location']"
+    else:
+        product_location_condition = "product_location"
+
+    # Adjust SQL based on column existence
+    if resource_id_column_exists:
+        select_fields = f"DISTINCT line_item_resource_id,\n{product_location_condition} as region,"
+        group_by_fields = "GROUP BY 1, 2"
+    else:
+        select_fields = f"'Unknown Resource' as line_item_resource_id,\n{product_location_condition} as region,"
+        group_by_fields = "GROUP BY 2"
+
+    l_SQL = f"""SELECT 
+{select_fields}
+SUM(line_item_usage_amount) as usage, 
+SUM(line_item_unblended_cost) as cost 
+FROM {{cur_table}} 
+WHERE 
+{{account_id}} 
+line_item_line_item_type = 'Usage' 
+AND line_item_usage_type LIKE '%EBS:SnapshotUsage' 
+AND line_item_usage_start_date BETWEEN DATE_ADD('month', -1, DATE('{{max_date}}')) AND DATE('{{max_date}}') 
+{group_by_fields};"""
+
+    # Remove newlines for better compatibility with some SQL engines
+    return l_SQL.replace('\n', '').replace('\t', ' ')
+
+
 class CurAgedebssnapshotscost(CurBase):
     """
     A class for identifying and reporting on aged EBS snapshots costs in AWS environments.
@@ -67,6 +101,10 @@ class CurAgedebssnapshotscost(CurBase):
         return self.set_estimate_savings(True)
 
     def set_estimate_savings(self, sum=False) -> float:
+        # This report only lists costs, no need to look at the DataFrame when savings are not displayed
+        if self.report_result and not self.report_result[0].get('DisplayPotentialSavings', True):
+            return 0.0
+
         df = self.get_report_dataframe()
 
         if sum and (df is not None) and (not df.empty) and (self.ESTIMATED_SAVINGS_CAPTION in df.columns):
@@ -87,10 +125,7 @@ class CurAgedebssnapshotscost(CurBase):
                 if query_results is None or query_results.empty:
                     return 0.0
 
-                total_savings = 0.0
-                for _, row in query_results.iterrows():
-                    savings = float(row[self.ESTIMATED_SAVINGS_CAPTION])
-                    total_savings += savings
+                total_savings = float(pd.to_numeric(query_results[self.ESTIMATED_SAVINGS_CAPTION], errors='coerce').sum())
 
                 self._savings = total_savings
                 return total_savings
@@ -99,7 +134,7 @@ class CurAgedebssnapshotscost(CurBase):
 
     def count_rows(self) -> int:
         try:
-            return self.report_result[0]['Data'].shape[0] if not self.report_result[0]['Data'].empty else 0
+            return len(self.report_result[0]['Data'].index)
         except Exception as e:
             self.appConfig.logger.warning(f"Error in {self.name()}: {str(e)}")
             return 0
@@ -121,19 +156,11 @@ class CurAgedebssnapshotscost(CurBase):
         query_execution_id = response['QueryExecutionId']
         self.query_id = query_execution_id
         
-        while True:
-            response = athena_client.get_query_execution(QueryExecutionId=query_execution_id)
-            state = response['QueryExecution']['Status']['State']
-            
-            if state in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
-                break
-            
-            time.sleep(1)
-        
+        response = _wait_for_athena(athena_client, query_execution_id)
+        state = response['QueryExecution']['Status']['State']
+
         if state == 'SUCCEEDED':
-            response = athena_client.get_query_results(QueryExecutionId=query_execution_id)
-            results = response['ResultSet']['Rows']
-            return results
+            return _get_athena_rows(athena_client, query_execution_id)
         else:
             l_msg = f"{response['QueryExecution']['Status']['StateChangeReason']}"
             raise Exception(l_msg)
@@ -154,57 +181,87 @@ class CurAgedebssnapshotscost(CurBase):
             self.logger.error(l_msg)
             return
 
-        data_list = []
-
         if len(response) == 0:
             print(f"No resources found for athena request {p_SQL}.")
         else:
-            if display:
+            # First pass: parse the snapshot ids of all the rows at once from the resource ids
+            # (arn:aws:ec2:<region>:<account>:snapshot/snap-...) and collect them by region, so snapshots
+            # are described with one batched describe_snapshots call per region instead of one call per row
+            rows = response[1:]
+            resource_ids = pd.Series([r['Data'][0].get('VarCharValue') for r in rows], dtype=object)
+            regions = [r['Data'][1].get('VarCharValue', '') for r in rows]
+            has_snapshot = resource_ids.str.contains('snapshot/', regex=False, na=False)
+            snapshot_ids = resource_ids.str.split('snapshot/').str[1].where(has_snapshot, '').tolist()
+
+            snapshot_ids_by_region = defaultdict(list)
+            for l_region, snapshot_id in zip(regions, snapshot_ids):
+                if snapshot_id:
+                    snapshot_ids_by_region[l_region].append(snapshot_id)
+            snapshots_info = self.snapshots.get_snapshots_info_by_region(snapshot_ids_by_region)
+
+            cols = self.get_required_columns()
+            cols_extended = self.get_required_columns_extended()
+
+            # Fill one list per column rather than one dict per row. Rows without a resource id only
+            # have the CUR columns, their snapshot columns are left empty
+            columns = {col: [] for col in cols_extended}
+            snapshot_only_cols = [col for col in cols_extended if col not in cols]
+            has_snapshot_info = False
+
+            # Only pay for the per-row progress bar refresh when it is actually displayed
+            if display and self.appConfig.mode == 'cli':
                 display_msg = f'[green]Running Cost & Usage Report: {report_name} / {self.appConfig.selected_regions}[/green]'
+                iterator = track(zip(rows, regions, snapshot_ids), description=display_msg, total=len(rows))
             else:
-                display_msg = ''
-
-            iterator = track(response[1:], description=display_msg) if self.appConfig.mode == 'cli' else response[1:]
-            for resource in iterator:
-                # try catch block to get the snapshot info using self.snapshot
+                iterator = zip(rows, regions, snapshot_ids)
+            for resource, l_region, snapshot_id in iterator:
+                data = resource['Data']
+                # try catch block to get the snapshot info fetched above
                 try:
-                    snapshot_id = resource['Data'][0]['VarCharValue'].split('snapshot/')[1] if 'snapshot/' in resource['Data'][0]['VarCharValue'] else ''
-                    l_region = resource['Data'][1]['VarCharValue'] if 'VarCharValue' in resource['Data'][1] else ''
+                    # Rows without resource id only keep the CUR columns
+                    l_resource_id = data[0]['VarCharValue']
 
-                    snapshot_size_info = self.snapshots.get_snapshot_info(snapshot_id, l_region)
+                    snapshot_size_info = snapshots_info.get((l_region, snapshot_id))
                     if snapshot_size_info is None:
                         self.appConfig.logger.warning(f"Could not get detailed block information for snapshot {snapshot_id} in region {l_region}")
                         continue
-                    volume_size_gib = snapshot_size_info.get('volume_size_gib', 0)
-                    volume_size_bytes = snapshot_size_info.get('volume_size_bytes', 0)
-                    start_time = snapshot_size_info.get('start_time', '')
-                    description = snapshot_size_info.get('description', '')
-                    state = snapshot_size_info.get('state', '')
-                    actual_data_size_gib = snapshot_size_info.get('actual_data_size_gib', 0)
-                
-                    data_dict = {
-                        self.get_required_columns_extended()[0]: resource['Data'][0]['VarCharValue'] if 'VarCharValue' in resource['Data'][0] else '',
-                        self.get_required_columns_extended()[1]: l_region,
-                        self.get_required_columns_extended()[2]: snapshot_id,
-                        self.get_required_columns_extended()[3]: volume_size_gib,
-                        self.get_required_columns_extended()[4]: volume_size_bytes,
-                        self.get_required_columns_extended()[5]: start_time,
-                        self.get_required_columns_extended()[6]: description,
-                        self.get_required_columns_extended()[7]: state,
-                        self.get_required_columns_extended()[8]: resource['Data'][2]['VarCharValue'] if 'VarCharValue' in resource['Data'][2] else 0,
-                        self.get_required_columns_extended()[9]: resource['Data'][3]['VarCharValue'] if 'VarCharValue' in resource['Data'][3] else 0.0,
-                        self.get_required_columns_extended()[10]: resource['Data'][3]['VarCharValue'] if 'VarCharValue' in resource['Data'][3] else 0.0
-                    }
+
+                    cost = data[3].get('VarCharValue', 0.0)
+                    values = (
+                        l_resource_id,
+                        l_region,
+                        snapshot_id,
+                        snapshot_size_info.get('volume_size_gib', 0),
+                        snapshot_size_info.get('volume_size_bytes', 0),
+                        snapshot_size_info.get('start_time', ''),
+                        snapshot_size_info.get('description', ''),
+                        snapshot_size_info.get('state', ''),
+                        data[2].get('VarCharValue', 0),
+                        cost,
+                        cost
+                    )
+                    has_snapshot_info = True
                 except Exception as e:
-                    data_dict = {
-                        self.get_required_columns()[0]: resource['Data'][0]['VarCharValue'] if 'VarCharValue' in resource['Data'][0] else '',
-                        self.get_required_columns()[1]: resource['Data'][1]['VarCharValue'] if 'VarCharValue' in resource['Data'][1] else '',
-                        self.get_required_columns()[2]: resource['Data'][2]['VarCharValue'] if 'VarCharValue' in resource['Data'][2] else 0,
-                        self.get_required_columns()[3]: resource['Data'][3]['VarCharValue'] if 'VarCharValue' in resource['Data'][3] else 0.0
-                    }
-                data_list.append(data_dict)
-
-            df = pd.DataFrame(data_list)
+                    cur_values = dict(zip(cols, (
+                        data[0].get('VarCharValue', ''),
+                        data[1].get('VarCharValue', ''),
+                        data[2].get('VarCharValue', 0),
+                        data[3].get('VarCharValue', 0.0)
+                    )))
+                    values = [cur_values.get(col) for col in cols_extended]
+
+                for column, value in zip(columns.values(), values):
+                    column.append(value)
+
+            if not has_snapshot_info:
+                for col in snapshot_only_cols:
+                    del columns[col]
+            df = pd.DataFrame(columns) if columns[cols[0]] else pd.DataFrame()
+
+            # Few distinct regions and snapshot states: store them as categories rather than Python strings
+            for col in ('region', 'state'):
+                if col in df.columns:
+                    df[col] = df[col].astype('category')
             self.report_result.append({'Name': self.name(), 'Data': df, 'Type': self.chart_type_of_excel, 'DisplayPotentialSavings':False})
             self.report_definition = {'LINE_VALUE': 6, 'LINE_CATEGORY': 3}
 
@@ -235,44 +292,23 @@ class CurAgedebssnapshotscost(CurBase):
     def get_expected_column_headers(self) -> list:
         return self.get_required_columns()
 
-    def sql(self, fqdb_name: str, payer_id: str, account_id: str, region: str, max_date: str, current_cur_version: str, resource_id_column_exists: str):
+    # Only the CUR version and the presence of the resource id column change the shape of the query,
+    # so its 4 variants are built once at class load and just filled in by sql()
+    _SQL_TEMPLATES = {
+        (is_cur_v2, resource_id_column_exists): _build_sql_template(is_cur_v2, resource_id_column_exists)
+        for is_cur_v2 in (True, False) for resource_id_column_exists in (True, False)
+    }
 
-        # generation of CUR has 2 types, legacy old and new v2.0 using dataexport.
-        # The structure of Athena depends of the type of CUR
-        # Also, Use may or may not include resource_if into the Athena CUR        
-        if (current_cur_version == 'v2.0'):
-            product_location_condition = "product['location']"
-        else:
-            product_location_condition = "product_location"
-        
-        # Adjust SQL based on column existence
-        if resource_id_column_exists:
-            select_fields = f"DISTINCT line_item_resource_id,\n{product_location_condition} as region,"
-            group_by_fields = "GROUP BY 1, 2"
-        else:
-            select_fields = f"'Unknown Resource' as line_item_resource_id,\n{product_location_condition} as region,"
-            group_by_fields = "GROUP BY 2"
+    def sql(self, fqdb_name: str, payer_id: str, account_id: str, region: str, max_date: str, current_cur_version: str, resource_id_column_exists: str):
 
-        l_SQL = f"""SELECT 
-{select_fields}
-SUM(line_item_usage_amount) as usage, 
-SUM(line_item_unblended_cost) as cost 
-FROM {self.cur_table} 
-WHERE 
-{account_id} 
-line_item_line_item_type = 'Usage' 
-AND line_item_usage_type LIKE '%EBS:SnapshotUsage' 
-AND line_item_usage_start_date BETWEEN DATE_ADD('month', -1, DATE('{max_date}')) AND DATE('{max_date}') 
-{group_by_fields};"""
+        l_SQL2 = self._SQL_TEMPLATES[(current_cur_version == 'v2.0', bool(resource_id_column_exists))].format(
+            cur_table=self.cur_table, account_id=account_id, max_date=max_date)
 
-        # Remove newlines for better compatibility with some SQL engines
-        l_SQL2 = l_SQL.replace('\n', '').replace('\t', ' ')
-        
         # Format the SQL query for better readability:
         # - Convert keywords to uppercase for standard SQL style
         # - Remove indentation to create a compact query string
         # - Keep inline comments for maintaining explanations in the formatted query
-        l_SQL3 = sqlparse.format(l_SQL2, keyword_case='upper', reindent=False, strip_comments=True)
+        l_SQL3 = format_sql(l_SQL2)
         
         # Return the formatted query in a dictionary
         # This allows for easy extraction and potential addition of metadata in the future
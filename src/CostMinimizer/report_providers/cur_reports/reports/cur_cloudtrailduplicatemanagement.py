@@ -4,11 +4,54 @@
 __author__ = "Samuel Lepetre"
 __license__ = "Apache-2.0"
 
-from ..cur_base import CurBase
+from ..cur_base import CurBase, _wait_for_athena, _get_athena_rows, format_sql
 import pandas as pd
-import time
-import sqlparse
-from rich.progress import track
+
+def _build_sql_template(is_cur_v2, resource_id_column_exists):
+    """Build the query of the report with {cur_table}, {account_id} and {max_date} placeholders"""
+
+    # generation of CUR has 2 types, legacy old and new v2.0 using dataexport.
+    # The structure of Athena depends of the type of CUR
+    # Also, Use may or may not include resource_if into the Athena CUR
+    if is_cur_v2:
+        product_column_str_condition = "product['product_name'] = 'AWS CloudTrail'"
+        product_region_code_condition = "product['region'] as product_region_code"
+    else:
+        product_column_str_condition = "product_product_name = 'AWS CloudTrail'"
+        product_region_code_condition = "product_region_code"
+
+    # Adjust SQL based on column existence
+    if resource_id_column_exists:
+        select_fields = f"line_item_usage_account_id, {product_region_code_condition}, line_item_resource_id,"
+        group_by_fields = "GROUP BY 1, 2, 3 "
+        trail_name_field = "COALESCE(t.line_item_resource_id, 'Unknown Trail') as trail_name"
+    else:
+        select_fields = f"line_item_usage_account_id, {product_region_code_condition},"
+        group_by_fields = "GROUP BY 1, 2"
+        trail_name_field = "'Unknown Trail' as trail_name"
+
+    l_SQL= f"""WITH trail_data AS (
+  SELECT 
+    {select_fields} 
+    sum(line_item_unblended_cost) as cost 
+  FROM {{cur_table}}  
+  WHERE 
+    {{account_id}} 
+    line_item_usage_start_date BETWEEN DATE_ADD('month', -1, DATE('{{max_date}}')) AND DATE('{{max_date}}') 
+    AND {product_column_str_condition} 
+    AND line_item_usage_type like '%PaidEventsRecorded%' 
+  {group_by_fields}
+) 
+SELECT 
+  t.line_item_usage_account_id, 
+  t.product_region_code, 
+  {trail_name_field}, 
+  t.cost 
+FROM trail_data t 
+ORDER BY t.line_item_usage_account_id, t.product_region_code, t.cost DESC;"""
+
+    # Remove newlines for better compatibility with some SQL engines
+    return l_SQL.replace('\n', '').replace('\t', ' ')
 
 class CurCloudtrailduplicatemanagement(CurBase):
     """
@@ -18,6 +61,13 @@ class CurCloudtrailduplicatemanagement(CurBase):
     to identify duplicate CloudTrail management events that may lead to unnecessary costs.
     """
 
+    def __init__(self, app) -> None:
+        super().__init__(app)
+
+        # CloudTrail clients by region and trail names by (account_id, region)
+        self._cloudtrail_clients = {}
+        self._trail_names_cache = {}
+
     def name(self):
         return "cur_cloudtrailduplicatemanagement"
 
@@ -79,17 +129,14 @@ class CurCloudtrailduplicatemanagement(CurBase):
             if query_results is None or query_results.empty:
                 return 0.0
 
-            total_savings = 0.0
-            for _, row in query_results.iterrows():
-                savings = float(row[self.ESTIMATED_SAVINGS_CAPTION])
-                total_savings += savings
+            total_savings = float(pd.to_numeric(query_results[self.ESTIMATED_SAVINGS_CAPTION], errors='coerce').sum())
 
             self._savings = total_savings
             return total_savings
 
     def count_rows(self) -> int:
         try:
-            return self.report_result[0]['Data'].shape[0] if not self.report_result[0]['Data'].empty else 0
+            return len(self.report_result[0]['Data'].index)
         except Exception as e:
             self.appConfig.logger.warning(f"Error in {self.name()}: {str(e)}")
             return 0
@@ -111,19 +158,11 @@ class CurCloudtrailduplicatemanagement(CurBase):
         query_execution_id = response['QueryExecutionId']
         self.query_id = query_execution_id
         
-        while True:
-            response = athena_client.get_query_execution(QueryExecutionId=query_execution_id)
-            state = response['QueryExecution']['Status']['State']
-            
-            if state in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
-                break
-            
-            time.sleep(1)
-        
+        response = _wait_for_athena(athena_client, query_execution_id)
+        state = response['QueryExecution']['Status']['State']
+
         if state == 'SUCCEEDED':
-            response = athena_client.get_query_results(QueryExecutionId=query_execution_id)
-            results = response['ResultSet']['Rows']
-            return results
+            return _get_athena_rows(athena_client, query_execution_id)
         else:
             l_msg = f"Query failed with state: {response['QueryExecution']['Status']['StateChangeReason']}"
             raise Exception(l_msg)
@@ -144,27 +183,18 @@ class CurCloudtrailduplicatemanagement(CurBase):
             self.logger.error(l_msg)
             return
 
-        data_list = []
-
         if len(response) == 0:
             print(f"No resources found for athena request {p_SQL}.")
         else:
-            if display:
-                display_msg = f'[green]Running Cost & Usage Report: {report_name} / {self.appConfig.selected_regions}[/green]'
-            else:
-                display_msg = ''
-            iterator = track(response[1:], description=display_msg) if self.appConfig.mode == 'cli' else response[1:]
-            for resource in iterator:
-                data_dict = {
-                    self.get_required_columns()[0]: resource['Data'][0]['VarCharValue'] if 'VarCharValue' in resource['Data'][0] else '',
-                    self.get_required_columns()[1]: resource['Data'][1]['VarCharValue'] if 'VarCharValue' in resource['Data'][1] else '',
-                    self.get_required_columns()[2]: resource['Data'][2]['VarCharValue'] if 'VarCharValue' in resource['Data'][2] else '',
-                    self.get_required_columns()[3]: resource['Data'][3]['VarCharValue'] if 'VarCharValue' in resource['Data'][3] else 0.0,
-                    self.get_required_columns()[4]: resource['Data'][3]['VarCharValue'] if 'VarCharValue' in resource['Data'][3] else 0.0
-                }
-                data_list.append(data_dict)
-
-            df = pd.DataFrame(data_list)
+            # Flatten the Athena rows into tuples and build the DataFrame in one shot
+            cols = self.get_required_columns()
+            records = [tuple(cell.get('VarCharValue', '') for cell in r['Data']) for r in response[1:]]
+            df = pd.DataFrame.from_records(records, columns=cols[:4])
+
+            # Few distinct regions: store them as categories rather than Python strings
+            df[cols[1]] = df[cols[1]].astype('category')
+            df[cols[3]] = pd.to_numeric(df[cols[3]], errors='coerce').fillna(0.0)
+            df[cols[4]] = df[cols[3]]
             self.report_result.append({'Name': self.name(), 'Data': df, 'Type': self.chart_type_of_excel, 'DisplayPotentialSavings':True})
             self.report_definition = {'LINE_VALUE': 6, 'LINE_CATEGORY': 3}
 
@@ -180,74 +210,48 @@ class CurCloudtrailduplicatemanagement(CurBase):
     def get_expected_column_headers(self) -> list:
         return self.get_required_columns()
 
+    def _cloudtrail_client(self, region):
+        """Return the CloudTrail client of a region, created once per report"""
+        if region not in self._cloudtrail_clients:
+            self._cloudtrail_clients[region] = self.appConfig.auth_manager.aws_cow_account_boto_session.client('cloudtrail', region_name=region)
+        return self._cloudtrail_clients[region]
+
     def get_cloudtrail_names(self, account_id, region):
         """Get CloudTrail trail names for a specific account and region"""
+        key = (account_id, region)
+        if key in self._trail_names_cache:
+            return list(self._trail_names_cache[key])
+
         try:
-            # Create a session with the specified account and region
-            session = self.appConfig.auth_manager.aws_cow_account_boto_session.client.Session()
-            cloudtrail_client = session.client('cloudtrail', region_name=region)
-            
-            # List trails in the account
-            response = cloudtrail_client.list_trails()
-            trails = response.get('Trails', [])
-            
-            # Extract trail names and return as a list
-            trail_names = [trail.get('Name', 'Unknown') for trail in trails]
-            return trail_names
+            cloudtrail_client = self._cloudtrail_client(region)
+
+            # List trails in the account, all pages as list_trails is paginated
+            paginator = cloudtrail_client.get_paginator('list_trails')
+            trail_names = tuple(trail.get('Name', 'Unknown') for page in paginator.paginate() for trail in page.get('Trails', []))
         except Exception as e:
             self.logger.error(f"Error retrieving CloudTrail names: {str(e)}")
             return ["Unknown"]
+
+        self._trail_names_cache[key] = trail_names
+        return list(trail_names)
     
-    def sql(self, fqdb_name: str, payer_id: str, account_id: str, region: str, max_date: str, current_cur_version: str, resource_id_column_exists: str):
+    # Only the CUR version and the presence of the resource id column change the shape of the query,
+    # so its 4 variants are built once at class load and just filled in by sql()
+    _SQL_TEMPLATES = {
+        (is_cur_v2, resource_id_column_exists): _build_sql_template(is_cur_v2, resource_id_column_exists)
+        for is_cur_v2 in (True, False) for resource_id_column_exists in (True, False)
+    }
 
-        # generation of CUR has 2 types, legacy old and new v2.0 using dataexport.
-        # The structure of Athena depends of the type of CUR
-        # Also, Use may or may not include resource_if into the Athena CUR   
-        if (current_cur_version == 'v2.0'):
-            product_column_str_condition = "product['product_name'] = 'AWS CloudTrail'"
-            product_region_code_condition = "product['region'] as product_region_code"
-        else:
-            product_column_str_condition = "product_product_name = 'AWS CloudTrail'"
-            product_region_code_condition = "product_region_code"
-
-        # Adjust SQL based on column existence
-        if resource_id_column_exists:
-            select_fields = f"line_item_usage_account_id, {product_region_code_condition}, line_item_resource_id,"
-            group_by_fields = "GROUP BY 1, 2, 3 "
-            trail_name_field = "COALESCE(t.line_item_resource_id, 'Unknown Trail') as trail_name"
-        else:
-            select_fields = f"line_item_usage_account_id, {product_region_code_condition},"
-            group_by_fields = "GROUP BY 1, 2"
-            trail_name_field = "'Unknown Trail' as trail_name"
+    def sql(self, fqdb_name: str, payer_id: str, account_id: str, region: str, max_date: str, current_cur_version: str, resource_id_column_exists: str):
 
-        l_SQL= f"""WITH trail_data AS (
-  SELECT 
-    {select_fields} 
-    sum(line_item_unblended_cost) as cost 
-  FROM {self.cur_table}  
-  WHERE 
-    {account_id} 
-    line_item_usage_start_date BETWEEN DATE_ADD('month', -1, DATE('{max_date}')) AND DATE('{max_date}') 
-    AND {product_column_str_condition} 
-    AND line_item_usage_type like '%PaidEventsRecorded%' 
-  {group_by_fields}
-) 
-SELECT 
-  t.line_item_usage_account_id, 
-  t.product_region_code, 
-  {trail_name_field}, 
-  t.cost 
-FROM trail_data t 
-ORDER BY t.line_item_usage_account_id, t.product_region_code, t.cost DESC;"""
+        l_SQL2 = self._SQL_TEMPLATES[(current_cur_version == 'v2.0', bool(resource_id_column_exists))].format(
+            cur_table=self.cur_table, account_id=account_id, max_date=max_date)
 
-        # Remove newlines for better compatibility with some SQL engines
-        l_SQL2 = l_SQL.replace('\n', '').replace('\t', ' ')
-        
         # Format the SQL query for better readability:
         # - Convert keywords to uppercase for standard SQL style
         # - Remove indentation to create a compact query string
         # - Keep inline comments for maintaining explanations in the formatted query
-        l_SQL3 = sqlparse.format(l_SQL2, keyword_case='upper', reindent=False, strip_comments=True)
+        l_SQL3 = format_sql(l_SQL2)
         
         # Return the formatted query in a dictionary
         # This allows for easy extraction and potential addition of metadata in the future
@@ -4,11 +4,129 @@
 __author__ = "Samuel Lepetre"
 __license__ = "Apache-2.0"
 
-from ..cur_base import CurBase
+from ..cur_base import CurBase, _start_athena_query, _wait_for_athena, _get_athena_rows, _athena_rows_to_dataframe, _read_athena_result_csv
 import pandas as pd
-import time
-import sqlparse
-from rich.progress import track
+import functools
+from typing import Optional
+
+@functools.lru_cache(maxsize=None)
+def _build_sql_template(current_cur_version, resource_id_column_exists, billing_period_column_exists=False):
+    """
+    Build the formatted query of the report with {cur_table}, {account_id} and {max_date} placeholders
+
+    Only the CUR version, the presence of the resource id column and of the billing_period partition
+    change the query, so it is built once per variant and sql() just fills the placeholders in.
+    """
+
+    # generation of CUR has 2 types, legacy old and new v2.0 using dataexport.
+    # The structure of Athena depends of the type of CUR
+    # Also, Use may or may not include resource_if into the Athena CUR 
+    if (current_cur_version == 'v2.0'):
+        line_item_product_code_condition = "product['product_name'] = 'Amazon DynamoDB'"
+    else:
+        line_item_product_code_condition = "line_item_product_code = 'AmazonDynamoDB'"
+    
+    # Base SQL with conditional resource_id handling
+    if resource_id_column_exists:
+        resource_select = "line_item_resource_id"
+        resource_group = "line_item_resource_id,"
+        resource_where = """AND line_item_resource_id LIKE '%dynamodb%' 
+AND line_item_resource_id NOT LIKE '%backup%'"""
+    else:
+        resource_select = "'Unknown Resource' as line_item_resource_id"
+        resource_group = ""
+        resource_where = ""
+
+    # When the table is partitioned by billing_period, restrict the scan to the 2 billing periods
+    # covered by the date range so Athena prunes the other partitions
+    if billing_period_column_exists:
+        billing_period_where = "AND billing_period IN (date_format(DATE_ADD('month', -1, DATE('{max_date}')), '%Y-%m'), date_format(DATE('{max_date}'), '%Y-%m')) "
+    else:
+        billing_period_where = ""
+
+    l_SQL= f"""WITH candidates AS ( 
+SELECT 
+line_item_usage_account_id, 
+{resource_select}, 
+_verdict, 
+_actual_throughput_cost, 
+_actual_storage_cost, 
+_uses_reservations, 
+line_item_usage_start_date, 
+line_item_usage_end_date, 
+( 
+CASE 
+WHEN _verdict LIKE '%IA' THEN ( 
+0.6 *(_actual_storage_cost) - 0.25 *(_actual_throughput_cost) 
+) ELSE 0 
+END 
+) AS _potential_savings, 
+( 
+CASE 
+WHEN _verdict LIKE '%IA' THEN ( 
+0.6 *(_actual_storage_cost) - 0.25 *(_actual_throughput_cost) 
+)/(round(date_diff('month',line_item_usage_start_date,line_item_usage_end_date)))  ELSE 0 
+END 
+) AS _potential_monthly_savings 
+FROM ( 
+SELECT line_item_usage_account_id,{resource_select}, 
+( 
+CASE 
+WHEN _uses_reservations = 0 
+AND _actual_storage_cost > 0.5 *(_actual_throughput_cost) 
+THEN 'Candidate for Standard_IA' 
+END 
+) AS _verdict, 
+_actual_throughput_cost, 
+_actual_storage_cost, 
+line_item_usage_start_date, 
+line_item_usage_end_date, 
+_uses_reservations 
+FROM ( 
+SELECT {resource_select},line_item_usage_account_id, 
+MAX( 
+CASE 
+WHEN 'pricing_term' = 'Reserved' 
+THEN 1 
+ELSE 0 
+END 
+)   AS _uses_reservations, 
+SUM( 
+CASE 
+WHEN line_item_usage_type LIKE '%RequestUnits' AND line_item_usage_type NOT LIKE '%IA%' THEN line_item_blended_cost 
+WHEN line_item_usage_type LIKE '%CapacityUnit-Hrs' AND line_item_usage_type NOT LIKE '%IA%' THEN line_item_blended_cost ELSE 0 
+END 
+) AS _actual_throughput_cost, 
+SUM( 
+CASE 
+WHEN line_item_usage_type LIKE '%TimedStorage-ByteHrs' AND line_item_usage_type NOT LIKE '%IA%' THEN line_item_blended_cost ELSE 0 
+END 
+) AS _actual_storage_cost, 
+MIN(line_item_usage_start_date) AS line_item_usage_start_date, 
+MAX(line_item_usage_end_date) AS line_item_usage_end_date 
+FROM 
+{{cur_table}} 
+WHERE 
+{{account_id}} 
+{line_item_product_code_condition} 
+{resource_where}
+{billing_period_where}AND line_item_usage_start_date BETWEEN DATE_ADD('month', -1, DATE('{{max_date}}')) AND DATE('{{max_date}}') 
+GROUP BY {resource_group}line_item_usage_account_id 
+) 
+) 
+where _verdict = 'Candidate for Standard_IA' and round(date_diff('month', line_item_usage_start_date, line_item_usage_end_date)) >0 
+) 
+SELECT *, SUM(_potential_monthly_savings) OVER () AS _total_savings 
+FROM candidates 
+ORDER BY _potential_savings DESC"""
+
+    # Note: We use SUM(line_item_unblended_cost) to get the total cost across all usage records
+    # for each unique combination of account, resource, and usage type. This gives us the
+    # overall cost impact of inter-AZ traffic for each resource.
+
+    # Remove newlines for better compatibility with some SQL engines. The query has no comments
+    # and Athena keywords are case insensitive, so it is sent as is without going through sqlparse
+    return l_SQL.replace('\n', '').replace('\t', ' ')
 
 class CurDdbiaopt(CurBase):
     """
@@ -18,6 +136,9 @@ class CurDdbiaopt(CurBase):
     to identify potential cost savings by optimizing DynamoDB tables for infrequent access patterns.
     """
 
+    # Sum of the estimated savings of all the candidates, computed by Athena along with the rows
+    _total_savings = None
+
     def name(self):
         return "cur_ddbiaopt"
 
@@ -76,30 +197,53 @@ class CurDdbiaopt(CurBase):
             if self.report_result[0]['DisplayPotentialSavings'] is False:
                 return 0.0
             else:        
-                query_results = self.get_query_result()
+                # The total is already aggregated by the query, no need to walk the rows
+                if self._total_savings is not None:
+                    self._savings = self._total_savings
+                    return self._total_savings
+
+                query_results = self._result_df()
                 if query_results is None or query_results.empty:
                     return 0.0
 
-                total_savings = 0.0
-                for _, row in query_results.iterrows():
-                    savings = float(row[self.ESTIMATED_SAVINGS_CAPTION])
-                    total_savings += savings
+                total_savings = float(pd.to_numeric(query_results[self.ESTIMATED_SAVINGS_CAPTION], errors='coerce').fillna(0.0).sum())
 
                 self._savings = total_savings
                 return total_savings
-        except:
+        except (IndexError, KeyError, ValueError, TypeError) as e:
+            self.logger.warning(f"Error in {self.name()}: {str(e)}")
             return 0.0
 
+    def _result_df(self) -> Optional[pd.DataFrame]:
+        """Return the DataFrame of the report, None when the query returned nothing"""
+        return self.report_result[0]['Data'] if self.report_result else None
+
     def count_rows(self) -> int:
+        df = self._result_df()
+        return 0 if df is None or df.empty else df.shape[0]
+
+    def run_athena_query(self, athena_client, query, s3_results_queries, athena_database):
+        """Run an Athena query and return its result rows, the column header being the first row"""
+        query_execution = self._execute_athena_query(athena_client, query, s3_results_queries, athena_database)
+        return _get_athena_rows(athena_client, query_execution['QueryExecutionId'])
+
+    def run_athena_query_df(self, athena_client, query, s3_results_queries, athena_database) -> pd.DataFrame:
+        """Run an Athena query and return its result as a DataFrame of strings, read from the result CSV on S3"""
+        query_execution = self._execute_athena_query(athena_client, query, s3_results_queries, athena_database)
+        query_execution_id = query_execution['QueryExecutionId']
         try:
-            return self.report_result[0]['Data'].shape[0] if not self.report_result[0]['Data'].empty else 0
+            s3_client = self.appConfig.auth_manager.aws_cow_account_boto_session.client('s3')
+            return _read_athena_result_csv(s3_client, query_execution)
         except Exception as e:
-            self.appConfig.logger.warning(f"Error in {self.name()}: {str(e)}")
-            return 0
+            self.logger.warning(f"Could not read the results of query {query_execution_id} from S3, paginating them instead: {e}")
+            return _athena_rows_to_dataframe(_get_athena_rows(athena_client, query_execution_id))
 
-    def run_athena_query(self, athena_client, query, s3_results_queries, athena_database):
+    def _execute_athena_query(self, athena_client, query, s3_results_queries, athena_database) -> dict:
+        """Start an Athena query, wait for it and return its QueryExecution once it succeeded"""
         try:
-            response = athena_client.start_query_execution(
+            response = _start_athena_query(
+                athena_client,
+                self.get_athena_result_reuse_minutes(),
                 QueryString=query,
                 QueryExecutionContext={
                     'Database': athena_database
@@ -114,19 +258,11 @@ class CurDdbiaopt(CurBase):
         query_execution_id = response['QueryExecutionId']
         self.query_id = query_execution_id
         
-        while True:
-            response = athena_client.get_query_execution(QueryExecutionId=query_execution_id)
-            state = response['QueryExecution']['Status']['State']
-            
-            if state in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
-                break
-            
-            time.sleep(1)
-        
+        response = _wait_for_athena(athena_client, query_execution_id)
+        state = response['QueryExecution']['Status']['State']
+
         if state == 'SUCCEEDED':
-            response = athena_client.get_query_results(QueryExecutionId=query_execution_id)
-            results = response['ResultSet']['Rows']
-            return results
+            return response['QueryExecution']
         else:
             l_msg = f"Query failed with state: {response['QueryExecution']['Status']['StateChangeReason']}"
             raise Exception(l_msg)
@@ -139,42 +275,31 @@ class CurDdbiaopt(CurBase):
         self.set_chart_type_of_excel()
 
         try:
-            cur_db = self.appConfig.arguments_parsed.cur_db if (hasattr(self.appConfig.arguments_parsed, 'cur_db') and self.appConfig.arguments_parsed.cur_db is not None) else self.appConfig.config['cur_db']
-            response = self.run_athena_query(client, p_SQL, self.appConfig.config['cur_s3_bucket'], cur_db)
+            # CUR database and bucket are resolved once by setup(), from --cur-db or the configuration
+            response = self.run_athena_query_df(client, p_SQL, self.cur_s3_bucket, self.cur_db)
         except Exception as e:
             l_msg = f"Athena Query failed with state: {e} - Verify tooling CUR configuration via --configure"
             self.appConfig.console.print("\n[red]"+l_msg)
             self.logger.error(l_msg)
             return
 
-        data_list = []
-
-        if len(response) == 0:
+        # The result always carries the header, so no rows means no candidate table
+        if response.empty:
             print(f"No resources found for athena request {p_SQL}.")
-        else:
-            if display:
-                display_msg = f'[green]Running Cost & Usage Report: {report_name} / {self.appConfig.selected_regions}[/green]'
-            else:
-                display_msg = ''
-            iterator = track(response[1:], description=display_msg) if self.appConfig.mode == 'cli' else response[1:]
-            for resource in iterator:
-                data_dict = {
-                    self.get_required_columns()[0]: resource['Data'][0]['VarCharValue'] if 'VarCharValue' in resource['Data'][0] else '',
-                    self.get_required_columns()[1]: resource['Data'][1]['VarCharValue'] if 'VarCharValue' in resource['Data'][1] else '',
-                    self.get_required_columns()[2]: resource['Data'][2]['VarCharValue'] if 'VarCharValue' in resource['Data'][2] else '',
-                    self.get_required_columns()[3]: resource['Data'][3]['VarCharValue'] if 'VarCharValue' in resource['Data'][3] else '',
-                    self.get_required_columns()[4]: resource['Data'][4]['VarCharValue'] if 'VarCharValue' in resource['Data'][4] else '',
-                    self.get_required_columns()[5]: resource['Data'][5]['VarCharValue'] if 'VarCharValue' in resource['Data'][5] else '',
-                    self.get_required_columns()[6]: resource['Data'][6]['VarCharValue'] if 'VarCharValue' in resource['Data'][6] else '',
-                    self.get_required_columns()[7]: resource['Data'][7]['VarCharValue'] if 'VarCharValue' in resource['Data'][7] else '',
-                    self.get_required_columns()[8]: resource['Data'][8]['VarCharValue'] if 'VarCharValue' in resource['Data'][8] else 0.0,
-                    self.get_required_columns()[9]: resource['Data'][9]['VarCharValue'] if 'VarCharValue' in resource['Data'][9] else 0.0
-                }
-                data_list.append(data_dict)
+            return
 
-            df = pd.DataFrame(data_list)
-            self.report_result.append({'Name': self.name(), 'Data': df, 'Type': self.chart_type_of_excel, 'DisplayPotentialSavings':True})
-            self.report_definition = {'LINE_VALUE': 6, 'LINE_CATEGORY': 3}
+        # The query result is already a DataFrame of strings, only name its columns
+        cols = self.get_required_columns()
+        df = response
+        df.columns = cols + ['_total_savings']
+        for col in cols[8:10]:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0)
+
+        # Same total on every row, keep it aside rather than in the report
+        total_savings = pd.to_numeric(df.pop('_total_savings'), errors='coerce')
+        self._total_savings = float(total_savings.iloc[0]) if pd.notna(total_savings.iloc[0]) else 0.0
+        self.report_result.append({'Name': self.name(), 'Data': df, 'Type': self.chart_type_of_excel, 'DisplayPotentialSavings':True})
+        self.report_definition = {'LINE_VALUE': 6, 'LINE_CATEGORY': 3}
 
     def get_required_columns(self) -> list:
         return [
@@ -195,110 +320,10 @@ class CurDdbiaopt(CurBase):
 
     def sql(self, fqdb_name: str, payer_id: str, account_id: str, region: str, max_date: str, current_cur_version: str, resource_id_column_exists: str):
 
-        # generation of CUR has 2 types, legacy old and new v2.0 using dataexport.
-        # The structure of Athena depends of the type of CUR
-        # Also, Use may or may not include resource_if into the Athena CUR 
-        if (current_cur_version == 'v2.0'):
-            line_item_product_code_condition = "product['product_name'] = 'Amazon DynamoDB'"
-        else:
-            line_item_product_code_condition = "line_item_product_code = 'AmazonDynamoDB'"
-        
-        # Base SQL with conditional resource_id handling
-        if resource_id_column_exists:
-            resource_select = "line_item_resource_id"
-            resource_group = "line_item_resource_id,"
-            resource_where = """AND line_item_resource_id LIKE '%dynamodb%' 
-AND line_item_resource_id NOT LIKE '%backup%'"""
-        else:
-            resource_select = "'Unknown Resource' as line_item_resource_id"
-            resource_group = ""
-            resource_where = ""
-
-        l_SQL= f"""SELECT 
-line_item_usage_account_id, 
-{resource_select}, 
-_verdict, 
-_actual_throughput_cost, 
-_actual_storage_cost, 
-_uses_reservations, 
-line_item_usage_start_date, 
-line_item_usage_end_date, 
-( 
-CASE 
-WHEN _verdict LIKE '%IA' THEN ( 
-0.6 *(_actual_storage_cost) - 0.25 *(_actual_throughput_cost) 
-) ELSE 0 
-END 
-) AS _potential_savings, 
-( 
-CASE 
-WHEN _verdict LIKE '%IA' THEN ( 
-0.6 *(_actual_storage_cost) - 0.25 *(_actual_throughput_cost) 
-)/(round(date_diff('month',line_item_usage_start_date,line_item_usage_end_date)))  ELSE 0 
-END 
-) AS _potential_monthly_savings 
-FROM ( 
-SELECT line_item_usage_account_id,{resource_select}, 
-( 
-CASE 
-WHEN _uses_reservations = 0 
-AND _actual_storage_cost > 0.5 *(_actual_throughput_cost) 
-THEN 'Candidate for Standard_IA' 
-END 
-) AS _verdict, 
-_actual_throughput_cost, 
-_actual_storage_cost, 
-line_item_usage_start_date, 
-line_item_usage_end_date, 
-_uses_reservations 
-FROM ( 
-SELECT {resource_select},line_item_usage_account_id, 
-MAX( 
-CASE 
-WHEN 'pricing_term' = 'Reserved' 
-THEN 1 
-ELSE 0 
-END 
-)   AS _uses_reservations, 
-SUM( 
-CASE 
-WHEN line_item_usage_type LIKE '%RequestUnits' AND line_item_usage_type NOT LIKE '%IA%' THEN line_item_blended_cost 
-WHEN line_item_usage_type LIKE '%CapacityUnit-Hrs' AND line_item_usage_type NOT LIKE '%IA%' THEN line_item_blended_cost ELSE 0 
-END 
-) AS _actual_throughput_cost, 
-SUM( 
-CASE 
-WHEN line_item_usage_type LIKE '%TimedStorage-ByteHrs' AND line_item_usage_type NOT LIKE '%IA%' THEN line_item_blended_cost ELSE 0 
-END 
-) AS _actual_storage_cost, 
-MIN(line_item_usage_start_date) AS line_item_usage_start_date, 
-MAX(line_item_usage_end_date) AS line_item_usage_end_date 
-FROM 
-{self.cur_table} 
-WHERE 
-{account_id} 
-{line_item_product_code_condition} 
-{resource_where}
-AND line_item_usage_start_date BETWEEN DATE_ADD('month', -1, DATE('{max_date}')) AND DATE('{max_date}') 
-GROUP BY {resource_group}line_item_usage_account_id 
-) 
-) 
-where _verdict = 'Candidate for Standard_IA' and round(date_diff('month', line_item_usage_start_date, line_item_usage_end_date)) >0 
-ORDER BY _potential_savings DESC"""
-
-        # Note: We use SUM(line_item_unblended_cost) to get the total cost across all usage records
-        # for each unique combination of account, resource, and usage type. This gives us the
-        # overall cost impact of inter-AZ traffic for each resource.
+        billing_period_column_exists = self.appConfig.resource_discovery.billing_period_column_exists
+        l_SQL3 = _build_sql_template(current_cur_version, bool(resource_id_column_exists), billing_period_column_exists).format(
+            cur_table=self.cur_table, account_id=account_id, max_date=max_date)
 
-        # Remove newlines for better compatibility with some SQL engines
-        l_SQL2 = l_SQL.replace('\n', '').replace('\t', ' ')
-        
-        # Format the SQL query for better readability:
-        # - Convert keywords to uppercase for standard SQL style
-        # - Remove indentation to create a compact query string
-        # - Keep inline comments for maintaining explanations in the formatted query
-        l_SQL3 = sqlparse.format(l_SQL2, keyword_case='upper', reindent=False, strip_comments=True)
-        
         # Return the formatted query in a dictionary
         # This allows for easy extraction and potential addition of metadata in the future
         return {"query": l_SQL3}
@@ -4,42 +4,127 @@
 __author__ = "Samuel Lepetre"
 __license__ = "Apache-2.0"
 
-from ..cur_base import CurBase
+from ..cur_base import CurBase, _start_athena_query, _wait_for_athena, format_sql, _get_athena_rows, _athena_rows_to_dataframe, _read_athena_result_csv
 import pandas as pd
-import time
-import sqlparse
-import uuid
+import secrets
 import boto3
+import functools
+import itertools
 import datetime
 from datetime import timezone
-from rich.progress import track
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config as bc_config
+from botocore.exceptions import ClientError
+from typing import Iterator
+
+# Concurrent GetMetricData calls over all the account-region batches, kept below the client max_pool_connections
+_CW_MAX_WORKERS = 20
+# Connections are read over the last _CW_WINDOW_DAYS days at a _CW_PERIOD seconds resolution
+_CW_PERIOD = 300
+_CW_WINDOW_DAYS = 7
+# GetMetricData accepts up to 500 metric queries per call, one query per cluster. Datapoints beyond the
+# 100,800 returned per call come in the following NextToken pages
+_CW_MAX_QUERIES_PER_CALL = 500
+
+def _build_sql_template(is_cur_v2, resource_id_column_exists):
+    """Build the query of the report with {cur_table}, {account_id} and {max_date} placeholders"""
+
+    # generation of CUR has 2 types, legacy old and new v2.0 using dataexport.
+    # The structure of Athena depends of the type of CUR
+    # Also, Use may or may not include resource_if into the Athena CUR 
+    # Adjust SQL based on column existence
+    if resource_id_column_exists:
+        resource_select = "SPLIT_PART(line_item_resource_id,':',7) AS line_item_resource_id"
+        resource_group = "line_item_resource_id,"
+    else:
+        resource_select = "'Unknown Resource' as line_item_resource_id"
+        resource_group = ""
+
+    if is_cur_v2:
+        product_region_condition = "product['region']"
+        line_item_product_code_condition = "product['product_name'] = 'AmazonDocDB'"
+    else:
+        product_region_condition = "product_region"
+        line_item_product_code_condition = "line_item_product_code = 'AmazonDocDB'"
+
+    l_SQL = f"""SELECT 
+line_item_usage_account_id, 
+{resource_select}, 
+{product_region_condition}, 
+sum(CAST(line_item_unblended_cost AS decimal(16,8))) AS estimated_savings 
+FROM {{cur_table}} 
+WHERE 
+{{account_id}} 
+line_item_usage_start_date BETWEEN DATE_ADD('month', -1, DATE('{{max_date}}')) AND DATE('{{max_date}}') 
+AND {line_item_product_code_condition} 
+AND line_item_line_item_type NOT IN ('Tax','Credit','Refund','Fee','RIFee') 
+GROUP BY 
+{resource_group}
+line_item_usage_account_id,
+{product_region_condition}"""
+
+    # Remove newlines for better compatibility with some SQL engines
+    return l_SQL.replace('\n', '').replace('\t', ' ')
 
 # CloudWatch client class
 class Cloudwatch:
     def __init__(self, account=None, region=None):
         """Initialize CloudWatch client with account and region"""
+        # The client is shared by the batches fetched concurrently, size its pool and absorb throttling accordingly
+        config = bc_config(max_pool_connections=50, retries={'max_attempts': 10, 'mode': 'adaptive'})
         # Ensure region is not empty or None before creating client
         if region and region.strip():
-            self.client = boto3.client('cloudwatch', region_name=region)
+            self.client = boto3.client('cloudwatch', region_name=region, config=config)
         else:
             # Default to a valid region if none provided
-            self.client = boto3.client('cloudwatch', region_name='us-east-1')
+            self.client = boto3.client('cloudwatch', region_name='us-east-1', config=config)
         self.account = account
         self.region = region
     
-    def get_metric_data(self, end_time, start_time, metric_data_queries):
-        """Get metric data from CloudWatch"""
-        try:
-            response = self.client.get_metric_data(
-                MetricDataQueries=metric_data_queries,
-                StartTime=datetime.datetime.strptime(start_time, "%Y-%m-%dT%H:%M:%SZ"),
-                EndTime=datetime.datetime.strptime(end_time, "%Y-%m-%dT%H:%M:%SZ")
-            )
-            return response
-        except Exception as e:
-            self.logger.info(f"Error getting metric data: {e}")
-            return {"metricDataResults": []}
+    def get_metric_data(self, end_time, start_time, metric_data_queries, stop_when_all_active=False):
+        """
+        Get metric data from CloudWatch between the start_time and end_time datetimes
+
+        Follows NextToken and merges the Timestamps and Values of each query Id, so that no result is
+        returned truncated. With stop_when_all_active, paging stops as soon as every query has a non zero
+        datapoint, the remaining pages cannot change that; those results keep their PartialData status.
+        Errors are raised to the caller.
+        """
+        request = {
+            'MetricDataQueries': metric_data_queries,
+            'StartTime': start_time,
+            'EndTime': end_time,
+            # Latest datapoints first, the most likely to show connections on an active cluster
+            'ScanBy': 'TimestampDescending'
+        }
+        results = {}
+        while True:
+            response = self.client.get_metric_data(**request)
+            for page_result in response.get('MetricDataResults', []):
+                result = results.get(page_result['Id'])
+                if result is None:
+                    results[page_result['Id']] = dict(page_result, Timestamps=list(page_result.get('Timestamps', [])), Values=list(page_result.get('Values', [])))
+                else:
+                    result['Timestamps'].extend(page_result.get('Timestamps', []))
+                    result['Values'].extend(page_result.get('Values', []))
+                    # PartialData on all pages but the last one
+                    result['StatusCode'] = page_result.get('StatusCode')
+
+            next_token = response.get('NextToken')
+            all_active = stop_when_all_active and len(results) == len(metric_data_queries) and all(any(result['Values']) for result in results.values())
+            if not next_token or all_active:
+                return {'MetricDataResults': list(results.values())}
+            request['NextToken'] = next_token
+
+
+@functools.lru_cache(maxsize=64)
+def _cloudwatch_client(account, region):
+    """
+    Return the Cloudwatch client of an account and region, created once per process and reused by every batch
 
+    Call it from the thread dispatching the batches: creating a client goes through the shared boto3 session.
+    """
+    return Cloudwatch(account=account, region=region)
 
 ####### TURNING THIS CHECK OFF - IT NEEDS TO BE REWRITTEN.  CLOUDWATCH CLASS SHOULD BE CENTRALIZED
 ####### ERRORS WITH THIS CHECK ON line 206 and link 330
@@ -106,137 +191,184 @@ class CurDocumentdbidlecost(CurBase):
         
     def calculate_savings(self):
         """Calculate potential savings ."""
-        try:
-            if self.report_result[0]['DisplayPotentialSavings'] is False:
-                return 0.0
-            else:        
-                query_results = self.get_query_result()
-                if query_results is None or query_results.empty:
-                    return 0.0
-
-                total_savings = 0.0
-                for _, row in query_results.iterrows():
-                    savings = float(row[self.ESTIMATED_SAVINGS_CAPTION])
-                    total_savings += savings
-
-                self._savings = total_savings
-                return total_savings
-        except:
+        results = self.report_result[0] if self.report_result else None
+        if not results or not results.get('DisplayPotentialSavings'):
+            return 0.0
+
+        query_results = self.get_query_result()
+        if query_results is None or query_results.empty or self.ESTIMATED_SAVINGS_CAPTION not in query_results.columns:
             return 0.0
 
+        total_savings = float(pd.to_numeric(query_results[self.ESTIMATED_SAVINGS_CAPTION], errors='coerce').sum())
+
+        self._savings = total_savings
+        return total_savings
+
     def count_rows(self) -> int:
-        try:
-            return self.report_result[0]['Data'].shape[0] if not self.report_result[0]['Data'].empty else 0
-        except Exception as e:
-            self.appConfig.logger.warning(f"Error in {self.name()}: {str(e)}")
-            return 0
+        df = self.report_result[0].get('Data') if self.report_result else None
+        return 0 if df is None or df.empty else df.shape[0]
             
     def get_cloudwatch_dicts(self, db_list) -> list:
         '''pass in a list of identifiers 
-        send to CW 50 at a time
+        send to CW _CW_MAX_QUERIES_PER_CALL at a time
         '''
-        query_metric_list = []
-        for db in db_list:
-            db_name = db['dBClusterIdentifier']
-        
-            db_uuid= 'a'+str(uuid.uuid4().hex)
-
-            temp_dict = {
-                    'Id': 'docdb',
-                    'MetricStat': {
-                            'Metric': {
-                            "Namespace": "AWS/DocDB",
-                            "MetricName": "DatabaseConnectionsMax",
-                            "Dimensions": [
-                                
-                            ]
-                            },
-                        'Period': 300,
-                        'Stat': 'Sum',
-                        }                    
+        # Query Ids must start with a lowercase letter and be unique within the call
+        query_metric_list = [
+            {
+                'Id': 'a' + secrets.token_hex(16),
+                'MetricStat': {
+                    'Metric': {
+                        "Namespace": "AWS/DocDB",
+                        "MetricName": "DatabaseConnectionsMax",
+                        "Dimensions": [{'Name': 'DBClusterIdentifier', 'Value': db['dBClusterIdentifier']}]
+                    },
+                    'Period': _CW_PERIOD,
+                    'Stat': 'Sum',
+                },
+                # Returned as is in the results, to match them back with their cluster
+                'Label': db['dBClusterIdentifier']
             }
-            
-            temp_dict['Id'] = db_uuid
-            db_key={}
-            db_key['Name'] = 'DBClusterIdentifier'
-            db_key['Value'] = db_name
-            temp_dict['MetricStat']['Metric']['Dimensions'].append(db_key)
-            
-            query_metric_list.append(temp_dict)
+            for db in db_list
+        ]
         self.logger.info(f'created CW dict')
         return query_metric_list
     
     def make_lists(self, items, n):
-        """Split a list into chunks of size n"""
-        return [items[i:i + n] for i in range(0, len(items), n)]
+        """Split an iterable into chunks of size n, yielded one at a time"""
+        it = iter(items)
+        return iter(lambda: list(itertools.islice(it, n)), [])
+
+    def get_batch_metric_data(self, cw_client, cluster_list, end_time, start_time, account, region):
+        """
+        Get the CloudWatch metrics of a batch of clusters
+
+        Returns a (response, error) tuple: the response is None and error holds the message when the
+        calls failed, so that the batch is skipped rather than read as idle.
+        """
+        metric_data_query_list = self.get_cloudwatch_dicts(cluster_list)
+        try:
+            # Only idle clusters need their full series, stop paging once every cluster of the batch had a connection
+            cw_resp = cw_client.get_metric_data(end_time=end_time, start_time=start_time, metric_data_queries=metric_data_query_list, stop_when_all_active=True)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'ValidationError' or len(cluster_list) < 2:
+                msg = f"Error getting CloudWatch metrics for account {account}, region {region}: {e}"
+                self.logger.error(msg)
+                return None, msg
+
+            # Batch rejected by CloudWatch, retry it in 2 halves
+            self.logger.info(f'CloudWatch rejected a batch of {len(cluster_list)} clusters, splitting it: {e}')
+            half = len(cluster_list) // 2
+            parts = [self.get_batch_metric_data(cw_client, part, end_time, start_time, account, region) for part in (cluster_list[:half], cluster_list[half:])]
+            errors = [error for _, error in parts if error]
+            return (
+                {'MetricDataResults': [cw_result for cw_resp, _ in parts if cw_resp for cw_result in cw_resp['MetricDataResults']]},
+                errors[0] if errors else None
+            )
+        except Exception as e:
+            # The batch is skipped, a failed call must never make its clusters look idle
+            msg = f"Error getting CloudWatch metrics for account {account}, region {region}: {e}"
+            self.logger.error(msg)
+            return None, msg
+
+        return cw_resp, None
     
-    #funtion outputs curated data needed for this check   
-    def process_check_data(self, account, region, client, result) -> list:
-        data_list = []
-        data_dict = {}
- 
-        self.error = {}
+    #funtion outputs curated data needed for this check, idle clusters only
+    def process_check_data(self, account_regions, result, errors) -> Iterator[dict]:
+        """
+        Yield the idle clusters of result in every (account, region) of account_regions
+
+        The errors met are recorded in the errors dict, by account, as the clusters are yielded.
+        """
         self.logger.info(f'processing check data')
         
         #make sure Internal response was successful
-        if result['danteCallStatus'] == 'SUCCESSFUL':  
-            self.logger.info(f'Internal call successful')
-            metric_data_query_list=[]
-            
-            cluster_lists = self.make_lists(result['dBClusters'], 50)
-            
-            for cluster_list in cluster_lists:
-                
-                metric_data_query_list = self.get_cloudwatch_dicts(cluster_list)
-                # Ensure region is valid before creating CloudWatch client
-                if not region or region == '':
-                    self.logger.warning(f"Empty region provided for account {account}, skipping CloudWatch metrics")
-                    continue
-                    
-                try:
-                    cw_client = Cloudwatch(account=account, region=region)
-                    date_format = "%Y-%m-%dT%H:%M:%SZ"
-                    end_time = datetime.datetime.now(timezone.utc).strftime(date_format)
-                    end_date = datetime.datetime.now(timezone.utc)
-                    start_time = (end_date-datetime.timedelta(7)).strftime(date_format)
-                    cw_resp = cw_client.get_metric_data(end_time=end_time, start_time=start_time, metric_data_queries=metric_data_query_list)
-                    if cw_resp == []:
-                        self.logger.info(f'No CloudWatch metrics found for account {account}, region {region}')
-                        continue
-                except Exception as e:
-                    self.logger.error(f"Error getting CloudWatch metrics for account {account}, region {region}: {e}")
-                    continue
-                
-                for cw_result in cw_resp['metricDataResults']:
-                    data_dict = {}
-                    seven_day_total = 0
-                    
-                    for stamp, value in zip(cw_result['timestamps'], cw_result['values']):
-                        seven_day_total += value
-                    data_dict['account'] = account
-                    data_dict['region'] = region
-                    data_dict['docdb_name'] = cw_result['label']
-                    data_dict['connection_count'] = seven_day_total
-                    for db in cluster_list:
-                        if data_dict['docdb_name'] == db['dBClusterIdentifier']:
-                            data_dict['dBClusterMembers'] = db['dBClusterMembers']
-                            data_dict['dbClusterResourceId'] = db['dbClusterResourceId']
-                            
-                            if seven_day_total == 0:
-                                data_list.append(data_dict)
-        else:
-            msg = f'ERROR: Internal call not successful for account: {account} region: {region}'
-            self.logger.info(msg)
-            self.error[account] = msg
-
-        del(result)
-        del(data_dict)
+        if result['danteCallStatus'] != 'SUCCESSFUL':
+            for account, region in account_regions:
+                msg = f'ERROR: Internal call not successful for account: {account} region: {region}'
+                self.logger.info(msg)
+                errors[account] = msg
+            return
 
-        return data_list
+        self.logger.info(f'Internal call successful')
+
+        # boto3 sessions are not thread safe, create the CloudWatch clients on this thread before dispatching
+        # the batches. Clients themselves are thread safe, the batches of a region share its client
+        tasks = []
+        for account, region in account_regions:
+            # Ensure region is valid before creating CloudWatch client
+            if not region:
+                self.logger.warning(f"Empty region provided for account {account}, skipping CloudWatch metrics")
+                continue
+
+            try:
+                cw_client = _cloudwatch_client(account, region)
+            except Exception as e:
+                msg = f"Error getting CloudWatch metrics for account {account}, region {region}: {e}"
+                self.logger.error(msg)
+                errors[account] = msg
+                continue
+
+            tasks.extend((account, region, cw_client, cluster_list) for cluster_list in self.make_lists(result['dBClusters'], _CW_MAX_QUERIES_PER_CALL))
+
+        # Last _CW_WINDOW_DAYS days, computed once and shared by all the batches
+        end_time = datetime.datetime.now(timezone.utc)
+        start_time = end_time - datetime.timedelta(days=_CW_WINDOW_DAYS)
+
+        # GetMetricData calls are I/O bound, fetch the batches of all the accounts and regions in one pool
+        with ThreadPoolExecutor(max_workers=_CW_MAX_WORKERS) as executor:
+            batch_resps = list(executor.map(
+                lambda task: self.get_batch_metric_data(task[2], task[3], end_time, start_time, task[0], task[1]),
+                tasks))
+
+        for (account, region, _, cluster_list), (cw_resp, error) in zip(tasks, batch_resps):
+            if error:
+                errors.setdefault(account, error)
+            if cw_resp is None:
+                continue
+
+            # Clusters of the batch by identifier, to match each CloudWatch result with a hash lookup
+            cluster_by_id = {db['dBClusterIdentifier']: db for db in cluster_list}
+
+            for cw_result in cw_resp['MetricDataResults']:
+                db = cluster_by_id.get(cw_result.get('Label'))
+
+                # Only a complete series tells that a cluster is idle, a partial or failed one is skipped.
+                # A single non zero datapoint means the cluster is not idle, any() stops at the first one.
+                # Only build the row of the idle clusters, the others are dropped anyway
+                if db is not None and cw_result.get('StatusCode') == 'Complete' and not any(cw_result['Values']):
+                    yield {
+                        'account': account,
+                        'region': region,
+                        'docdb_name': cw_result['Label'],
+                        'connection_count': 0,
+                        'dBClusterMembers': db['dBClusterMembers'],
+                        'dbClusterResourceId': db['dbClusterResourceId']
+                    }
 
     def run_athena_query(self, athena_client, query, s3_results_queries, athena_database):
+        """Run an Athena query and return its result rows, the column header being the first row"""
+        query_execution = self._execute_athena_query(athena_client, query, s3_results_queries, athena_database)
+        return _get_athena_rows(athena_client, query_execution['QueryExecutionId'])
+
+    def run_athena_query_df(self, athena_client, query, s3_results_queries, athena_database) -> pd.DataFrame:
+        """Run an Athena query and return its result as a DataFrame of strings, read from the result CSV on S3"""
+        query_execution = self._execute_athena_query(athena_client, query, s3_results_queries, athena_database)
+        query_execution_id = query_execution['QueryExecutionId']
         try:
-            response = athena_client.start_query_execution(
+            s3_client = self.appConfig.auth_manager.aws_cow_account_boto_session.client('s3')
+            return _read_athena_result_csv(s3_client, query_execution)
+        except Exception as e:
+            # get_query_results returns 1000 rows per call, page through all of them
+            self.logger.warning(f"Could not read the results of query {query_execution_id} from S3, paginating them instead: {e}")
+            return _athena_rows_to_dataframe(_get_athena_rows(athena_client, query_execution_id))
+
+    def _execute_athena_query(self, athena_client, query, s3_results_queries, athena_database) -> dict:
+        """Start an Athena query, wait for it and return its QueryExecution once it succeeded"""
+        try:
+            # Identical queries run within --athena-result-reuse minutes reuse the previous result instead of scanning the CUR again
+            response = _start_athena_query(
+                athena_client,
+                self.get_athena_result_reuse_minutes(),
                 QueryString=query,
                 QueryExecutionContext={
                     'Database': athena_database
@@ -251,19 +383,11 @@ class CurDocumentdbidlecost(CurBase):
         query_execution_id = response['QueryExecutionId']
         self.query_id = query_execution_id
         
-        while True:
-            response = athena_client.get_query_execution(QueryExecutionId=query_execution_id)
-            state = response['QueryExecution']['Status']['State']
-            
-            if state in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
-                break
-            
-            time.sleep(1)
-        
+        response = _wait_for_athena(athena_client, query_execution_id)
+        state = response['QueryExecution']['Status']['State']
+
         if state == 'SUCCEEDED':
-            response = athena_client.get_query_results(QueryExecutionId=query_execution_id)
-            results = response['ResultSet']['Rows']
-            return results
+            return response['QueryExecution']
         else:
             l_msg = f"Query failed with state: {response['QueryExecution']['Status']['StateChangeReason']}"
             raise Exception(l_msg)
@@ -276,77 +400,71 @@ class CurDocumentdbidlecost(CurBase):
 
         try:
             cur_db = self.appConfig.arguments_parsed.cur_db if (hasattr(self.appConfig.arguments_parsed, 'cur_db') and self.appConfig.arguments_parsed.cur_db is not None) else self.appConfig.config['cur_db']
-            response = self.run_athena_query(client, p_SQL, self.appConfig.config['cur_s3_bucket'], cur_db)
+            response = self.run_athena_query_df(client, p_SQL, self.appConfig.config['cur_s3_bucket'], cur_db)
         except Exception as e:
             l_msg = f"Athena Query failed with state: {e} - Verify tooling CUR configuration via --configure"
             self.appConfig.console.print("\n[red]"+l_msg)
             self.logger.error(l_msg)
             return
 
-        data_list = []
-
-        if len(response) == 0:
+        if len(response.columns) == 0:
             print(f"No resources found for athena request {p_SQL}.")
         else:
-            if display:
-                display_msg = f'[green]Running Cost & Usage Report: {report_name} / {self.appConfig.selected_regions}[/green]'
-            else:
-                display_msg = ''
-            iterator = track(response[1:], description=display_msg) if self.appConfig.mode == 'cli' else response[1:]
-            for resource in iterator:
-                data_dict = {
-                    self.get_required_columns()[0]: resource['Data'][0]['VarCharValue'] if 'VarCharValue' in resource['Data'][0] else '',
-                    self.get_required_columns()[1]: resource['Data'][1]['VarCharValue'] if 'VarCharValue' in resource['Data'][1] else '',
-                    self.get_required_columns()[2]: resource['Data'][2]['VarCharValue'] if 'VarCharValue' in resource['Data'][2] else '',
-                    self.get_required_columns()[3]: resource['Data'][3]['VarCharValue'] if 'VarCharValue' in resource['Data'][3] else 0.0,
-                    self.get_required_columns()[4]: resource['Data'][3]['VarCharValue'] if 'VarCharValue' in resource['Data'][3] else 0.0
-                }
-                data_list.append(data_dict)
-
-            df = pd.DataFrame(data_list)
+            if display and self.appConfig.mode == 'cli':
+                self.appConfig.console.print(f'[green]Running Cost & Usage Report: {report_name} / {self.appConfig.selected_regions}[/green]')
+
+            # The query result is already a DataFrame of strings, only name its columns
+            cols = self.get_required_columns()
+            df = response
+            df.columns = cols[:4]
+            # Few distinct accounts and regions: store them as categories rather than Python strings
+            df[cols[0]] = df[cols[0]].astype('category')
+            df[cols[2]] = df[cols[2]].astype('category')
+            df[cols[3]] = pd.to_numeric(df[cols[3]], errors='coerce').fillna(0.0)
+            df[cols[4]] = df[cols[3]]
             
-            # Get DocumentDB clusters from CUR results
-            docdb_clusters = []
-            for _, row in df.iterrows():
-                docdb_clusters.append({
-                    'dBClusterIdentifier': row['resource_id'],
+            # Get DocumentDB clusters from CUR results, reading the resource_id column rather than boxing each row
+            docdb_clusters = [
+                {
+                    'dBClusterIdentifier': resource_id,
                     'dBClusterMembers': [],  # This would be populated from actual API call
-                    'dbClusterResourceId': row['resource_id']
-                })
+                    'dbClusterResourceId': resource_id
+                }
+                for resource_id in (df['resource_id'].tolist() if not df.empty else [])
+            ]
             
             # Process the clusters to check for idle ones
             idle_clusters = []
+            self.error = {}
 
             # test if df is empty, if yes skip the rest of the function
             if not df.empty:
 
                 try:
                     # Get unique account-region combinations
-                    for account in df['usage_account_id'].unique():
-                        for region in df[df['usage_account_id'] == account]['region'].unique():
+                    account_regions = list(df[['usage_account_id', 'region']].drop_duplicates().itertuples(index=False, name=None))
 
-                            # Mock result structure similar to what would come from a DocumentDB API call
-                            mock_result = {
-                                'danteCallStatus': 'SUCCESSFUL',
-                                'dBClusters': docdb_clusters
-                            }
+                    # Mock result structure similar to what would come from a DocumentDB API call
+                    mock_result = {
+                        'danteCallStatus': 'SUCCESSFUL',
+                        'dBClusters': docdb_clusters
+                    }
 
-                            # Process the data to find idle clusters
-                            idle_data = self.process_check_data(account, region, None, mock_result)
-                            idle_clusters.extend(idle_data)
+                    # Process the data to find idle clusters, the errors of all the account-region pairs are kept together
+                    idle_clusters = list(self.process_check_data(account_regions, mock_result, self.error))
 
                     # Create a new DataFrame with idle clusters
                     if idle_clusters:
                         idle_df = pd.DataFrame(idle_clusters)
 
-                        # Merge with original cost data
-                        merged_df = pd.merge(
-                            df,
-                            idle_df,
-                            left_on='resource_id',
-                            right_on='docdb_name',
-                            how='inner'
-                        )
+                        # Join with original cost data on the cluster identifiers, keeping the column
+                        # names of an inner merge (region_x / region_y)
+                        merged_df = df.set_index('resource_id', drop=False).join(
+                            idle_df.set_index('docdb_name', drop=False),
+                            how='inner',
+                            lsuffix='_x',
+                            rsuffix='_y'
+                        ).reset_index(drop=True)
                         # If we found idle clusters, use the merged data
                         if not merged_df.empty:
                             df = merged_df
@@ -372,50 +490,23 @@ class CurDocumentdbidlecost(CurBase):
     def get_expected_column_headers(self) -> list:
         return self.get_required_columns()
 
+    # Only the CUR version and the presence of the resource id column change the shape of the query,
+    # so its 4 variants are built once at class load and just filled in by sql()
+    _SQL_TEMPLATES = {
+        (is_cur_v2, resource_id_column_exists): _build_sql_template(is_cur_v2, resource_id_column_exists)
+        for is_cur_v2 in (True, False) for resource_id_column_exists in (True, False)
+    }
+
     def sql(self, fqdb_name: str, payer_id: str, account_id: str, region: str, max_date: str, current_cur_version: str, resource_id_column_exists: str):
 
-        # generation of CUR has 2 types, legacy old and new v2.0 using dataexport.
-        # The structure of Athena depends of the type of CUR
-        # Also, Use may or may not include resource_if into the Athena CUR 
-        # Adjust SQL based on column existence
-        if resource_id_column_exists:
-            resource_select = "SPLIT_PART(line_item_resource_id,':',7) AS line_item_resource_id"
-            resource_group = "line_item_resource_id,"
-        else:
-            resource_select = "'Unknown Resource' as line_item_resource_id"
-            resource_group = ""
+        l_SQL2 = self._SQL_TEMPLATES[(current_cur_version == 'v2.0', bool(resource_id_column_exists))].format(
+            cur_table=self.cur_table, account_id=account_id, max_date=max_date)
 
-        if (current_cur_version == 'v2.0'):
-            product_region_condition = "product['region']"
-            line_item_product_code_condition = "product['product_name'] = 'AmazonDocDB'"
-        else:
-            product_region_condition = "product_region"
-            line_item_product_code_condition = "line_item_product_code = 'AmazonDocDB'"
-
-        l_SQL = f"""SELECT 
-line_item_usage_account_id, 
-{resource_select}, 
-{product_region_condition}, 
-sum(CAST(line_item_unblended_cost AS decimal(16,8))) AS estimated_savings 
-FROM {self.cur_table} 
-WHERE 
-{account_id} 
-line_item_usage_start_date BETWEEN DATE_ADD('month', -1, DATE('{max_date}')) AND DATE('{max_date}') 
-AND {line_item_product_code_condition} 
-AND line_item_line_item_type NOT IN ('Tax','Credit','Refund','Fee','RIFee') 
-GROUP BY 
-{resource_group}
-line_item_usage_account_id,
-{product_region_condition}"""
-
-        # Remove newlines for better compatibility with some SQL engines
-        l_SQL2 = l_SQL.replace('\n', '').replace('\t', ' ')
-        
         # Format the SQL query for better readability:
         # - Convert keywords to uppercase for standard SQL style
         # - Remove indentation to create a compact query string
         # - Keep inline comments for maintaining explanations in the formatted query
-        l_SQL3 = sqlparse.format(l_SQL2, keyword_case='upper', reindent=False, strip_comments=True)
+        l_SQL3 = format_sql(l_SQL2)
         
         # Return the formatted query in a dictionary
         # This allows for easy extraction and potential addition of metadata in the future
@@ -4,39 +4,72 @@
 __author__ = "Samuel Lepetre"
 __license__ = "Apache-2.0"
 
-from ..cur_base import CurBase
+from ..cur_base import CurBase, _wait_for_athena, _iter_athena_rows
 import pandas as pd
 import time
 import sqlparse
-from rich.progress import track
 import boto3
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config as bc_config
+
+# Concurrent DescribeTable calls, kept below the client max_pool_connections
+_DESCRIBE_TABLE_MAX_WORKERS = 16
+
+# ListGlobalTables responses by (account, region) and DescribeTable responses by (account, region, table name), shared by
+# every report run of the process and kept for _DYNAMODB_CACHE_TTL seconds
+_DYNAMODB_CACHE_TTL = 300
+_list_global_tables_cache = {}
+_describe_table_cache = {}
+
+def _get_cached(cache, key):
+    """Return the cached response of key, None when missing or older than _DYNAMODB_CACHE_TTL"""
+    entry = cache.get(key)
+    if entry is None or time.monotonic() - entry[0] > _DYNAMODB_CACHE_TTL:
+        return None
+    return entry[1]
 
 # Add DynamoDB client class
 class Dynamodb:
     def __init__(self, region, account=None):
         """Initialize DynamoDB client with region and account"""
-        self.client = boto3.client('dynamodb', region_name=region)
+        # The client is shared by the tables described concurrently, size its pool and absorb throttling accordingly
+        self.client = boto3.client('dynamodb', region_name=region,
+                                   config=bc_config(max_pool_connections=50, retries={'max_attempts': 10, 'mode': 'adaptive'}))
         self.account = account
         self.region = region
     
     def describe_table(self, table_name):
         """Describe a DynamoDB table"""
+        cache_key = (self.account, self.region, table_name)
+        response = _get_cached(_describe_table_cache, cache_key)
+        if response is not None:
+            return response
+
         try:
             response = self.client.describe_table(TableName=table_name)
-            return response
         except Exception as e:
             logging.error(f"Error describing table {table_name}: {e}")
             raise e
+
+        _describe_table_cache[cache_key] = (time.monotonic(), response)
+        return response
     
     def list_global_tables(self):
         """List global tables in the region"""
+        cache_key = (self.account, self.region)
+        response = _get_cached(_list_global_tables_cache, cache_key)
+        if response is not None:
+            return response
+
         try:
             response = self.client.list_global_tables()
-            return response
         except Exception as e:
             logging.error(f"Error listing global tables: {e}")
-            return {"globalTables": []}
+            return {"GlobalTables": []}
+
+        _list_global_tables_cache[cache_key] = (time.monotonic(), response)
+        return response
 
 class CurDynamodblegacyglobaltablescost(CurBase):
     """
@@ -126,6 +159,11 @@ class CurDynamodblegacyglobaltablescost(CurBase):
             return 0
 
     def run_athena_query(self, athena_client, query, s3_results_queries, athena_database):
+        """Run an Athena query and return its result rows as a list, the column header being the first row"""
+        return list(self.run_athena_query_iter(athena_client, query, s3_results_queries, athena_database))
+
+    def run_athena_query_iter(self, athena_client, query, s3_results_queries, athena_database):
+        """Run an Athena query and return a one-shot generator over its result rows, for addCurReport"""
         try:
             response = athena_client.start_query_execution(
                 QueryString=query,
@@ -142,47 +180,56 @@ class CurDynamodblegacyglobaltablescost(CurBase):
         query_execution_id = response['QueryExecutionId']
         self.query_id = query_execution_id
         
-        while True:
-            response = athena_client.get_query_execution(QueryExecutionId=query_execution_id)
-            state = response['QueryExecution']['Status']['State']
-            
-            if state in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
-                break
-            
-            time.sleep(1)
-        
+        response = _wait_for_athena(athena_client, query_execution_id)
+        state = response['QueryExecution']['Status']['State']
+
         if state == 'SUCCEEDED':
-            response = athena_client.get_query_results(QueryExecutionId=query_execution_id)
-            results = response['ResultSet']['Rows']
-            return results
+            # Rows are paged in lazily, get_query_results returns at most 1000 of them per call
+            return _iter_athena_rows(athena_client, query_execution_id)
         else:
             l_msg = f"Query failed with state: {response['QueryExecution']['Status']['StateChangeReason']}"
             raise Exception(l_msg)
 
+    def get_global_table_version(self, dynamodb_client, table_name, account, region) -> str:
+        """Get the version of a global table from its table details, '' when it cannot be described"""
+        try:
+            table = dynamodb_client.describe_table(table_name)
+        except Exception as e:
+            self.logger.info(f'Base global table not found in account: {account} region: {region}')
+            return ''
+        return table.get('Table', {}).get('GlobalTableVersion', '')
+
     def process_check_data(self, account, region, client, result) -> list:
         """Process global tables data to identify legacy tables"""
         self.logger.info(f'Processing global tables data for account: {account} region: {region}')
-        dynamodb_client = Dynamodb(region, account)
-        data_list = []
-        
-        for global_table in result.get('globalTables', []):
-            data_dict = {
+        # Reuse the client of the caller, and its DescribeTable cache, when one is given
+        dynamodb_client = client if client is not None else Dynamodb(region, account)
+        global_tables = result.get('GlobalTables', [])
+        table_names = [global_table.get('GlobalTableName', '') for global_table in global_tables]
+
+        # ListGlobalTables only returns version 2017.11.29 global tables, with their replication group:
+        # those are legacy without describing them, only the others need a DescribeTable call
+        versions = ['2017.11.29' if global_table.get('ReplicationGroup') else None for global_table in global_tables]
+        to_describe = [i for i, version in enumerate(versions) if version is None]
+
+        # DescribeTable calls are I/O bound, describe the remaining global tables concurrently
+        if to_describe:
+            with ThreadPoolExecutor(max_workers=_DESCRIBE_TABLE_MAX_WORKERS) as executor:
+                described = executor.map(
+                    lambda i: self.get_global_table_version(dynamodb_client, table_names[i], account, region),
+                    to_describe)
+                for i, version in zip(to_describe, described):
+                    versions[i] = version
+
+        return [
+            {
                 'line_item_usage_account_id': account,
                 'region': region,
-                'global_table_name': global_table.get('globalTableName', '')
+                'global_table_name': table_name,
+                'global_table_version': version
             }
-            
-            try:
-                # Try to get table details to determine version
-                table = dynamodb_client.describe_table(global_table.get('globalTableName', ''))
-                data_dict['global_table_version'] = table.get('table', {}).get('globalTableVersion', '')
-            except Exception as e:
-                self.logger.info(f'Base global table not found in account: {account} region: {region}')
-                data_dict['global_table_version'] = ''
-            
-            data_list.append(data_dict)
-        
-        return data_list
+            for table_name, version in zip(table_names, versions)
+        ]
 
     def addCurReport(self, client, p_SQL, range_categories, range_values, list_cols_currency, group_by, display = False, report_name = ''):
         self.graph_range_values_x1, self.graph_range_values_y1, self.graph_range_values_x2,  self.graph_range_values_y2 = range_values
@@ -192,35 +239,30 @@ class CurDynamodblegacyglobaltablescost(CurBase):
 
         try:
             cur_db = self.appConfig.arguments_parsed.cur_db if (hasattr(self.appConfig.arguments_parsed, 'cur_db') and self.appConfig.arguments_parsed.cur_db is not None) else self.appConfig.config['cur_db']
-            response = self.run_athena_query(client, p_SQL, self.appConfig.config['cur_s3_bucket'], cur_db)
+            response = self.run_athena_query_iter(client, p_SQL, self.appConfig.config['cur_s3_bucket'], cur_db)
+
+            # The first row is the column header, None when the query returned nothing at all
+            rows = iter(response)
+            header = next(rows, None)
+
+            # Create DataFrame from CUR data, consuming the result pages as they are fetched. The pages
+            # are fetched here, so an error on any of them is reported like those of the query
+            if header is not None:
+                cols = self.get_required_columns()
+                defaults = ('', '', 0, 0.0, 0.0)
+                records = (tuple(cell.get('VarCharValue', default) for cell, default in zip(resource['Data'], defaults)) for resource in rows)
+                cur_df = pd.DataFrame.from_records(records, columns=cols[:5])
         except Exception as e:
             l_msg = f"Athena Query failed with state: {e} - Verify tooling CUR configuration via --configure"
             self.appConfig.console.print("\n[red]"+l_msg)
             self.logger.error(l_msg)
             return
 
-        cur_data_list = []
-
-        if len(response) == 0:
+        if header is None:
             print(f"No resources found for athena request {p_SQL}.")
         else:
-            if display:
-                display_msg = f'[green]Running Cost & Usage Report: {report_name} / {self.appConfig.selected_regions}[/green]'
-            else:
-                display_msg = ''
-            iterator = track(response[1:], description=display_msg) if self.appConfig.mode == 'cli' else response[1:]
-            for resource in iterator:
-                data_dict = {
-                    self.get_required_columns()[0]: resource['Data'][0]['VarCharValue'] if 'VarCharValue' in resource['Data'][0] else '',
-                    self.get_required_columns()[1]: resource['Data'][1]['VarCharValue'] if 'VarCharValue' in resource['Data'][1] else '',
-                    self.get_required_columns()[2]: resource['Data'][2]['VarCharValue'] if 'VarCharValue' in resource['Data'][2] else 0,
-                    self.get_required_columns()[3]: resource['Data'][3]['VarCharValue'] if 'VarCharValue' in resource['Data'][3] else 0.0,
-                    self.get_required_columns()[4]: resource['Data'][4]['VarCharValue'] if 'VarCharValue' in resource['Data'][4] else 0.0
-                }
-                cur_data_list.append(data_dict)
-
-            # Create DataFrame from CUR data
-            cur_df = pd.DataFrame(cur_data_list)
+            if display and self.appConfig.mode == 'cli':
+                self.appConfig.console.print(f'[green]Running Cost & Usage Report: {report_name} / {self.appConfig.selected_regions}[/green]')
 
             # test if df is empty, if yes skip the rest of the function
             if not cur_df.empty:
@@ -228,10 +270,12 @@ class CurDynamodblegacyglobaltablescost(CurBase):
                 global_tables_data = []
                 region = self.appConfig.selected_region
                 try:
-                    dynamodb_client = Dynamodb(region)
+                    # The client runs with the credentials of the tooling account, its responses are cached under that account
+                    dynamodb_client = Dynamodb(region, self.appConfig.config['aws_cow_account'])
                     result = dynamodb_client.list_global_tables()
+                    # The global tables are listed and described once, the later CUR accounts and report runs reuse the cached responses
                     for account in cur_df['line_item_usage_account_id'].unique():
-                        processed_data = self.process_check_data(account, region, None, result)
+                        processed_data = self.process_check_data(account, region, dynamodb_client, result)
                         global_tables_data.extend(processed_data)
                 except Exception as e:
                     self.logger.error(f"Error getting global tables for region {region}: {e}")
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Test the Excel workbook generation of the CUR reports.
+"""
+
+import sys
+import os
+
+import pytest
+
+src_path = os.path.join(os.path.dirname(__file__), '..', 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("xlsxwriter")
+report_module = pytest.importorskip(
+    "CostMinimizer.report_providers.cur_reports.reports.cur_dynamodblegacyglobaltablescost",
+    exc_type=ImportError)
+
+
+def make_pivot_report(name):
+    """Return a report result with a non-empty pivot on its first column"""
+    return {
+        'Name': name,
+        'Data': pd.DataFrame({
+            'instance_type': ['m5.large', 'm5.large', 'c5.xlarge'],
+            'potential_savings': [10.0, 5.0, 20.0],
+        }),
+        'DisplayPotentialSavings': True,
+    }
+
+
+def test_generate_excel_writes_every_pivot_report(tmp_path):
+    """A pivot chart does not stop the sheets of the following reports from being generated"""
+    report = report_module.CurDynamodblegacyglobaltablescost.__new__(
+        report_module.CurDynamodblegacyglobaltablescost)
+    report.report_result = [make_pivot_report('first_report'), make_pivot_report('second_report')]
+    report.chart_type_of_excel = 'pivot'
+    report.list_cols_currency = [1]
+    report.group_by = [0]
+    report.graph_range_values_x1 = 1
+
+    with pd.ExcelWriter(tmp_path / 'report.xlsx', engine='xlsxwriter') as writer:
+        report.generateExcel(writer)
+        sheet_names = list(writer.book.sheetnames)
+
+    assert sheet_names == ['first_report', 'first_report-GroupBy', 'second_report', 'second_report-GroupBy']
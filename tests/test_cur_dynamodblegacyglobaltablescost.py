@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Test the legacy DynamoDB global tables check against a stubbed DynamoDB client.
+"""
+
+import sys
+import os
+import logging
+
+import pytest
+
+src_path = os.path.join(os.path.dirname(__file__), '..', 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+report_module = pytest.importorskip(
+    "CostMinimizer.report_providers.cur_reports.reports.cur_dynamodblegacyglobaltablescost",
+    exc_type=ImportError)
+
+
+class StubDynamodb:
+    """Record the DescribeTable calls and answer them with a version 2019.11.21 table"""
+    def __init__(self):
+        self.described = []
+
+    def describe_table(self, table_name):
+        self.described.append(table_name)
+        return {'Table': {'TableName': table_name, 'GlobalTableVersion': '2019.11.21'}}
+
+
+def test_replication_group_skips_describe_table():
+    """Tables listed with a ReplicationGroup are legacy without a DescribeTable call"""
+    report = report_module.CurDynamodblegacyglobaltablescost.__new__(
+        report_module.CurDynamodblegacyglobaltablescost)
+    report.logger = logging.getLogger(__name__)
+    client = StubDynamodb()
+    result = {
+        'GlobalTables': [
+            {'GlobalTableName': 'orders', 'ReplicationGroup': [{'RegionName': 'us-east-1'}]},
+            {'GlobalTableName': 'users'},
+        ]
+    }
+
+    rows = report.process_check_data('123456789012', 'us-east-1', client, result)
+
+    assert client.described == ['users']
+    assert [(row['global_table_name'], row['global_table_version']) for row in rows] == [
+        ('orders', '2017.11.29'),
+        ('users', '2019.11.21'),
+    ]
+    assert all(row['line_item_usage_account_id'] == '123456789012' for row in rows)